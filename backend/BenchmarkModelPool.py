@@ -0,0 +1,97 @@
+# BenchmarkModelPool.py
+# Sweep inference-pool settings on this machine and recommend the highest-throughput one.
+#   python BenchmarkModelPool.py                  -> classifier, every replicas x intra-op threads combination
+#   python BenchmarkModelPool.py --seq2seq        -> FLAN-T5 tier2 model instead (slow; lower --requests)
+#   python BenchmarkModelPool.py --workers 2      -> budget for one of 2 gunicorn workers sharing the cores
+# Prompts come from EvalGoldForms.json. Set the winner with MODEL_REPLICAS / TORCH_INTRA_OP_THREADS.
+import argparse
+import json
+import threading
+import time
+
+from transformers import pipeline
+
+from TrainingModel import TEACHER_MODEL_PATH
+from EvaluateModel import GOLD_FORMS_PATH, percentile
+from model_pool import ReplicaPool, available_cores, configure_torch_threads, replicate_pipeline
+
+BENCHMARK_REPORT_PATH = "model_pool_benchmark.json"
+
+
+def powers_of_two(limit):
+    value = 1
+    while value <= limit:
+        yield value
+        value *= 2
+
+
+def run_load(pool, prompts, requests, clients):
+    latencies, lock, next_index = [], threading.Lock(), [0]
+
+    def client():
+        while True:
+            with lock:
+                i = next_index[0]
+                if i >= requests: return
+                next_index[0] += 1
+            started = time.perf_counter()
+            pool(prompts[i % len(prompts)])
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {"throughput_rps": round(requests / wall, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1)}
+
+
+def main(args):
+    cores = max(1, len(available_cores()) // args.workers)
+    with open(GOLD_FORMS_PATH, 'r', encoding='utf-8') as f:
+        prompts = [item["prompt"] for item in json.load(f)]
+
+    # Inter-op threads can only be set once per process, before any parallel work.
+    configure_torch_threads(None, args.inter_op)
+    if args.seq2seq:
+        task, kwargs = "text2text-generation", {"device": -1, "max_new_tokens": 64, "do_sample": False}
+        first = pipeline(task, model="google/flan-t5-large", tokenizer="google/flan-t5-large", **kwargs)
+    else:
+        task, kwargs = "token-classification", {"aggregation_strategy": "simple"}
+        first = pipeline(task, model=args.model, **kwargs)
+    for prompt in prompts[:3]: first(prompt)   # warm-up
+
+    print(f"--- {task} on {cores} core(s) per worker, {args.requests} requests per setting ---")
+    print(f"{'replicas':>9}{'threads':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    results = []
+    for replicas in powers_of_two(cores):
+        for threads in powers_of_two(cores // replicas):
+            configure_torch_threads(threads, None)
+            pool = ReplicaPool(task, replicate_pipeline(first, replicas, task, **kwargs))
+            result = {"replicas": replicas, "intra_op_threads": threads,
+                      **run_load(pool, prompts, args.requests, clients=replicas * 2)}
+            results.append(result)
+            print(f"{replicas:>9}{threads:>9}{result['throughput_rps']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}")
+
+    best = max(results, key=lambda r: (r["throughput_rps"], -r["p95_ms"]))
+    print(f"\nRecommended: MODEL_REPLICAS={best['replicas']} TORCH_INTRA_OP_THREADS={best['intra_op_threads']} "
+          f"TORCH_INTER_OP_THREADS={args.inter_op} ({best['throughput_rps']} req/s, p95 {best['p95_ms']} ms)")
+    with open(BENCHMARK_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"task": task, "cores_per_worker": cores, "workers": args.workers,
+                   "results": results, "recommended": best}, f, indent=2)
+    print(f"Report written to {BENCHMARK_REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark model replica / thread settings.")
+    parser.add_argument("--model", default=TEACHER_MODEL_PATH, help="Token classifier to benchmark.")
+    parser.add_argument("--seq2seq", action="store_true", help="Benchmark the FLAN-T5 tier2 model instead.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1, help="Web workers that will share this machine's cores.")
+    parser.add_argument("--inter-op", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+# BuildEmbeddingIndex.py
+# Offline step: embed every template seed and field keyword once, so the server only
+# does a matrix-vector product per prompt. Re-run after editing fields.json / templates.json.
+#   python BuildEmbeddingIndex.py            -> float32 index
+#   python BuildEmbeddingIndex.py --int8     -> also write the int8-quantized copy
+import argparse
+import json
+import os
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from embedding_index import INDEX_DIR, EMBEDDING_MODEL, index_paths
+
+
+def collect_entries(fields_path='fields.json', templates_path='templates.json'):
+    with open(fields_path, 'r', encoding='utf-8') as f:
+        fields_data = json.load(f)
+    with open(templates_path, 'r', encoding='utf-8') as f:
+        templates_data = json.load(f)
+
+    entries, seen = [], set()
+
+    def add(kind, target, text):
+        text = " ".join(str(text).split())
+        if text and (kind, target, text.lower()) not in seen:
+            seen.add((kind, target, text.lower()))
+            entries.append({"kind": kind, "id": target, "text": text})
+
+    for key, value in templates_data.items():
+        if isinstance(value, dict):
+            add("template", key, key.replace("_", " "))
+            for seed in value.get("seeds", []):
+                add("template", key, seed)
+    for field in fields_data:
+        add("field", field["id"], field["label"])
+        for keyword in field.get("fuzzy_keywords", []):
+            add("field", field["id"], keyword)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the semantic template/field index.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--int8", action="store_true", help="Also write a per-row int8 quantized matrix.")
+    args = parser.parse_args()
+
+    entries = collect_entries()
+    print(f"--- Embedding {len(entries)} seeds/keywords with {args.model} ---")
+    encoder = SentenceTransformer(args.model)
+    matrix = encoder.encode([e["text"] for e in entries], batch_size=128, convert_to_numpy=True,
+                            normalize_embeddings=True, show_progress_bar=True).astype(np.float32)
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    paths = index_paths()
+    np.save(paths["matrix"], matrix)
+    if args.int8:
+        scale = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+        np.save(paths["int8"], np.round(matrix / scale).astype(np.int8))
+        np.save(paths["scale"], scale[:, 0].astype(np.float32))
+    with open(paths["meta"], 'w', encoding='utf-8') as f:
+        json.dump({"model": args.model, "dim": int(matrix.shape[1]), "entries": entries}, f, indent=1)
+
+    print(f"Index saved to '{INDEX_DIR}' ({matrix.shape[0]} x {matrix.shape[1]}, "
+          f"{matrix.nbytes / 2**20:.1f} MB float32{', + int8 copy' if args.int8 else ''}).")
+
+
+if __name__ == "__main__":
+    main()
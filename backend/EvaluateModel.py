@@ -0,0 +1,130 @@
+# EvaluateModel.py
+# Held-out evaluation for the token classifier and the tier1 pipeline.
+#   python EvaluateModel.py ner        -> per-label entity P/R/F1 + latency per batch size
+#   python EvaluateModel.py pipeline   -> tier1 field-set / template scores on EvalGoldForms.json
+#   python EvaluateModel.py            -> both
+# Train with `python TrainingModel.py --holdout` first so the NER split is really unseen.
+import argparse
+import json
+import time
+
+from TrainingModel import TEACHER_MODEL_PATH, split_examples, entity_scores, predict_tags
+
+GOLD_FORMS_PATH = "EvalGoldForms.json"
+EVAL_REPORT_PATH = "evaluation_report.json"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def evaluate_ner(model_path, eval_fraction, batch_sizes, repeats=3):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    with open('TrainingData.json', 'r', encoding='utf-8') as f:
+        examples = json.load(f)
+    _, held_out = split_examples(examples, eval_fraction)
+    print(f"--- NER evaluation on {len(held_out)} held-out examples ({model_path}) ---")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForTokenClassification.from_pretrained(model_path)
+    token_lists = [ex["tokens"] for ex in held_out]
+    scores = entity_scores([ex["tags"] for ex in held_out], predict_tags(model, tokenizer, token_lists))
+
+    print(f"{'label':<20}{'P':>8}{'R':>8}{'F1':>8}{'support':>9}")
+    for label, s in list(scores["per_label"].items()) + [("(micro)", scores["micro"])]:
+        print(f"{label:<20}{s['precision']:>8.3f}{s['recall']:>8.3f}{s['f1']:>8.3f}{s['support']:>9}")
+
+    latency = {}
+    predict_tags(model, tokenizer, token_lists[:8], batch_size=8)   # warm-up
+    for bs in batch_sizes:
+        per_batch = []
+        for _ in range(repeats):
+            for i in range(0, len(token_lists), bs):
+                t0 = time.perf_counter()
+                predict_tags(model, tokenizer, token_lists[i:i + bs], batch_size=bs)
+                per_batch.append((time.perf_counter() - t0) * 1000)
+        per_batch.sort()
+        mean = sum(per_batch) / len(per_batch)
+        latency[str(bs)] = {
+            "batch_mean_ms": round(mean, 3),
+            "batch_p95_ms": round(percentile(per_batch, 0.95), 3),
+            "per_example_ms": round(mean / bs, 3),
+        }
+        print(f"batch={bs:<4} mean {mean:8.2f} ms/batch   {mean / bs:7.2f} ms/example")
+
+    return {"model": model_path, "examples": len(held_out), "torch_threads": torch.get_num_threads(),
+            "scores": scores, "latency": latency}
+
+
+def evaluate_pipeline(gold_path, full=False):
+    # Importing app2 builds the real FormGenerator (knowledge base + models), exactly as served.
+    from app2 import form_gen
+
+    with open(gold_path, 'r', encoding='utf-8') as f:
+        gold_forms = json.load(f)
+    print(f"--- {'process_prompt' if full else 'tier1'} evaluation on {len(gold_forms)} gold prompts ---")
+
+    tp = fp = fn = exact = template_hits = 0
+    timings, cases = [], []
+    for item in gold_forms:
+        t0 = time.perf_counter()
+        defs, template = (form_gen.process_prompt if full else form_gen.tier1)(item["prompt"])
+        timings.append((time.perf_counter() - t0) * 1000)
+
+        predicted, expected = {d.id for d in defs}, set(item["fields"])
+        tp += len(predicted & expected); fp += len(predicted - expected); fn += len(expected - predicted)
+        exact += predicted == expected
+        # Template aliases resolve to the same dict, so "contact_us" counts as "contact".
+        same_template = template == item["template"] or (
+            template in form_gen.form_templates
+            and form_gen.form_templates.get(template) is form_gen.form_templates.get(item["template"]))
+        template_hits += same_template
+        cases.append({"prompt": item["prompt"], "template": template, "template_ok": same_template,
+                      "missing": sorted(expected - predicted), "extra": sorted(predicted - expected)})
+
+    p = tp / (tp + fp) if tp + fp else 0.0
+    r = tp / (tp + fn) if tp + fn else 0.0
+    timings_sorted = sorted(timings)
+    result = {
+        "prompts": len(gold_forms),
+        "field_precision": round(p, 4),
+        "field_recall": round(r, 4),
+        "field_f1": round(2 * p * r / (p + r) if p + r else 0.0, 4),
+        "exact_field_set": round(exact / len(gold_forms), 4),
+        "template_accuracy": round(template_hits / len(gold_forms), 4),
+        "latency_ms": {"mean": round(sum(timings) / len(timings), 3),
+                       "p50": round(percentile(timings_sorted, 0.5), 3),
+                       "p95": round(percentile(timings_sorted, 0.95), 3)},
+        "cases": cases,
+    }
+    for case in cases:
+        if not case["template_ok"] or case["missing"] or case["extra"]:
+            print(f"MISS '{case['prompt']}': template={case['template']} missing={case['missing']} extra={case['extra']}")
+    print(f"fields P/R/F1 {p:.3f}/{r:.3f}/{result['field_f1']:.3f}  exact {result['exact_field_set']:.3f}  "
+          f"template acc {result['template_accuracy']:.3f}  mean {result['latency_ms']['mean']:.1f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the NER model and the tier1 pipeline.")
+    parser.add_argument("target", nargs="?", choices=["ner", "pipeline", "all"], default="all")
+    parser.add_argument("--model", default=TEACHER_MODEL_PATH)
+    parser.add_argument("--gold", default=GOLD_FORMS_PATH)
+    parser.add_argument("--eval-fraction", type=float, default=0.1)
+    parser.add_argument("--batch-sizes", default="1,4,8,16,32")
+    parser.add_argument("--full", action="store_true", help="Score process_prompt (tier1 + tier2 fallback) instead of tier1.")
+    parser.add_argument("--output", default=EVAL_REPORT_PATH)
+    args = parser.parse_args()
+
+    report = {}
+    if args.target in ("ner", "all"):
+        report["ner"] = evaluate_ner(args.model, args.eval_fraction, [int(b) for b in args.batch_sizes.split(",")])
+    if args.target in ("pipeline", "all"):
+        report["pipeline"] = evaluate_pipeline(args.gold, full=args.full)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to '{args.output}'")
@@ -1,19 +1,88 @@
 # TrainingModel.py
-from datasets import load_dataset
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from datasets import load_dataset, Dataset
 from transformers import AutoTokenizer, AutoModelForTokenClassification, TrainingArguments, Trainer, DataCollatorForTokenClassification
 
-def main():
-    print("--- Loading Dataset ---")
-    raw_datasets = load_dataset('json', data_files='TrainingData.json', split="train")
+TEACHER_MODEL_PATH = "./FormGeneratorModel"
+STUDENT_MODEL_PATH = "./FormGeneratorModelStudent"
+DISTILL_REPORT_PATH = "distillation_report.json"
+SPLIT_INFO_FILE = "training_split.json"   # written next to the teacher: which examples it was trained on
 
-    print("--- Preparing Data for Training ---")
-    model_checkpoint = "distilbert-base-uncased"
-    tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
 
-    tags_list = sorted(list(set(tag for ex in raw_datasets for tag in ex['tags'])))
-    tag2id = {tag: i for i, tag in enumerate(tags_list)}
-    id2tag = {i: tag for i, tag in enumerate(tags_list)}
+# --- Shared helpers (also used by the distillation report) ---
+def split_examples(examples, eval_fraction=0.1):
+    """Deterministic train/eval split keyed on the example text, so reruns and new rows never reshuffle it."""
+    train, held_out = [], []
+    for ex in examples:
+        digest = hashlib.md5(" ".join(ex["tokens"]).encode("utf-8")).hexdigest()
+        bucket = int(digest[:8], 16) / 0xFFFFFFFF
+        (held_out if bucket < eval_fraction else train).append(ex)
+    return train, held_out
+
+
+def entity_spans(tags):
+    """BIO tags -> set of (label, start, end) spans, end exclusive. A stray I- opens a new span."""
+    spans, label, start = set(), None, None
+    for i, tag in enumerate(list(tags) + ["O"]):
+        prefix, _, name = tag.partition("-")
+        if label is not None and (prefix != "I" or name != label):
+            spans.add((label, start, i))
+            label = None
+        if prefix == "B" or (prefix == "I" and label is None):
+            label, start = name, i
+    return spans
+
+
+def entity_scores(gold_tag_lists, pred_tag_lists):
+    """Per-label and micro-averaged entity-level precision/recall/F1."""
+    counts = {}
+    for gold_tags, pred_tags in zip(gold_tag_lists, pred_tag_lists):
+        gold, pred = entity_spans(gold_tags), entity_spans(pred_tags)
+        for span in gold | pred:
+            c = counts.setdefault(span[0], {"tp": 0, "fp": 0, "fn": 0})
+            if span in gold and span in pred: c["tp"] += 1
+            elif span in pred: c["fp"] += 1
+            else: c["fn"] += 1
+
+    def prf(tp, fp, fn):
+        p = tp / (tp + fp) if tp + fp else 0.0
+        r = tp / (tp + fn) if tp + fn else 0.0
+        f = 2 * p * r / (p + r) if p + r else 0.0
+        return {"precision": round(p, 4), "recall": round(r, 4), "f1": round(f, 4), "support": tp + fn}
+
+    per_label = {label: prf(**c) for label, c in sorted(counts.items())}
+    total = {k: sum(c[k] for c in counts.values()) for k in ("tp", "fp", "fn")}
+    return {"per_label": per_label, "micro": prf(**total)}
+
 
+def predict_tags(model, tokenizer, token_lists, batch_size=16):
+    """Word-level BIO predictions (first sub-token of every word) for pre-tokenized inputs."""
+    import torch
+    model.eval()
+    id2label = model.config.id2label
+    predictions = []
+    for i in range(0, len(token_lists), batch_size):
+        batch = token_lists[i:i + batch_size]
+        enc = tokenizer(batch, truncation=True, is_split_into_words=True, padding=True, return_tensors="pt")
+        with torch.no_grad():
+            logits = model(input_ids=enc["input_ids"], attention_mask=enc["attention_mask"]).logits
+        best = logits.argmax(-1).tolist()
+        for b, words in enumerate(batch):
+            tags, prev = ["O"] * len(words), None
+            for pos, word_idx in enumerate(enc.word_ids(batch_index=b)):
+                if word_idx is not None and word_idx != prev:
+                    tags[word_idx] = id2label[best[b][pos]]
+                prev = word_idx
+            predictions.append(tags)
+    return predictions
+
+
+def tokenize_and_align_with(tokenizer, tag2id):
     def tokenize_and_align(examples):
         tokenized = tokenizer(examples["tokens"], truncation=True, is_split_into_words=True)
         labels = []
@@ -25,15 +94,34 @@ def main():
                 if word_idx is None:
                     label_ids.append(-100)
                 elif word_idx != prev_word_idx:
-                    label_ids.append(tag2id[label[word_idx]])
+                    label_ids.append(tag2id.get(label[word_idx], tag2id.get("O", 0)))
                 else:
                     label_ids.append(-100)
                 prev_word_idx = word_idx
             labels.append(label_ids)
         tokenized["labels"] = labels
         return tokenized
+    return tokenize_and_align
+
+
+def main(holdout=False, eval_fraction=0.1):
+    print("--- Loading Dataset ---")
+    raw_datasets = load_dataset('json', data_files='TrainingData.json', split="train")
+    if holdout:
+        # Keep the EvaluateModel.py split unseen so its scores are genuinely held out.
+        train_examples, held_out = split_examples(list(raw_datasets), eval_fraction)
+        raw_datasets = Dataset.from_list(train_examples)
+        print(f"Holding out {len(held_out)} examples for evaluation.")
+
+    print("--- Preparing Data for Training ---")
+    model_checkpoint = "distilbert-base-uncased"
+    tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
+
+    tags_list = sorted(list(set(tag for ex in raw_datasets for tag in ex['tags'])))
+    tag2id = {tag: i for i, tag in enumerate(tags_list)}
+    id2tag = {i: tag for i, tag in enumerate(tags_list)}
 
-    tokenized_datasets = raw_datasets.map(tokenize_and_align, batched=True)
+    tokenized_datasets = raw_datasets.map(tokenize_and_align_with(tokenizer, tag2id), batched=True)
 
     print("--- Setting up Trainer ---")
     model = AutoModelForTokenClassification.from_pretrained(
@@ -57,9 +145,197 @@ def main():
     trainer.train()
     print("--- Training Complete ---")
 
-    final_model_path = "./FormGeneratorModel"
+    final_model_path = TEACHER_MODEL_PATH
     trainer.save_model(final_model_path)
+    with open(os.path.join(final_model_path, SPLIT_INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"holdout": holdout, "eval_fraction": eval_fraction if holdout else None}, f)
     print(f"Model saved successfully to '{final_model_path}'")
 
+
+# --- Distillation: compact student trained on the teacher's soft labels ---
+def augment_examples(examples, fields_path='fields.json', templates_path='templates.json', copies=2, seed=13):
+    """Swap FIELD_NAME / FORM_TYPE spans for other keywords and seeds from the knowledge base."""
+    with open(fields_path, 'r', encoding='utf-8') as f:
+        field_keywords = sorted({kw for fd in json.load(f) for kw in fd.get("fuzzy_keywords", []) + [fd.get("label", "")] if kw})
+    with open(templates_path, 'r', encoding='utf-8') as f:
+        template_seeds = sorted({s for t in json.load(f).values() if isinstance(t, dict) for s in t.get("seeds", [])})
+    replacements = {"FIELD_NAME": field_keywords, "FORM_TYPE": template_seeds}
+
+    rng = random.Random(seed)
+    augmented = []
+    for ex in examples:
+        spans = sorted((s for s in entity_spans(ex["tags"]) if s[0] in replacements), key=lambda s: s[1])
+        if not spans: continue
+        for _ in range(copies):
+            tokens, tags, cursor = [], [], 0
+            for label, start, end in spans:
+                tokens += ex["tokens"][cursor:start]; tags += ex["tags"][cursor:start]
+                words = rng.choice(replacements[label]).split()
+                tokens += words; tags += [f"B-{label}"] + [f"I-{label}"] * (len(words) - 1)
+                cursor = end
+            tokens += ex["tokens"][cursor:]; tags += ex["tags"][cursor:]
+            augmented.append({"tokens": tokens, "tags": tags})
+    return augmented
+
+
+def measure_model(model, tokenizer, eval_examples, model_dir, latency_samples=200):
+    """Entity F1 on the held-out split plus single-prompt CPU latency and memory footprint."""
+    import torch
+    torch.set_num_threads(1)
+    gold = [ex["tags"] for ex in eval_examples]
+    pred = predict_tags(model, tokenizer, [ex["tokens"] for ex in eval_examples])
+    scores = entity_scores(gold, pred)
+
+    samples = [ex["tokens"] for ex in eval_examples[:latency_samples]] or [["contact", "form"]]
+    predict_tags(model, tokenizer, samples[:5], batch_size=1)   # warm-up
+    timings = []
+    for words in samples:
+        t0 = time.perf_counter()
+        predict_tags(model, tokenizer, [words], batch_size=1)
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+
+    param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    disk_bytes = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(model_dir) for name in files)
+    return {
+        "entity_f1": scores["micro"]["f1"],
+        "per_label": scores["per_label"],
+        "latency_ms": {
+            "mean": round(sum(timings) / len(timings), 3),
+            "p50": round(timings[len(timings) // 2], 3),
+            "p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        },
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "param_memory_mb": round(param_bytes / 2**20, 2),
+        "disk_mb": round(disk_bytes / 2**20, 2),
+    }
+
+
+def distill(args):
+    import torch
+    import torch.nn.functional as F
+    from transformers import DistilBertConfig, DistilBertForTokenClassification
+
+    print(f"--- Loading teacher from '{TEACHER_MODEL_PATH}' ---")
+    tokenizer = AutoTokenizer.from_pretrained(TEACHER_MODEL_PATH)
+    teacher = AutoModelForTokenClassification.from_pretrained(TEACHER_MODEL_PATH)
+    teacher.eval()
+    tag2id = {tag: int(i) for tag, i in teacher.config.label2id.items()}
+
+    # The teacher is only a fair baseline on the held-out split if it never trained on it.
+    split_path = os.path.join(TEACHER_MODEL_PATH, SPLIT_INFO_FILE)
+    split_info = {}
+    if os.path.exists(split_path):
+        with open(split_path, 'r', encoding='utf-8') as f:
+            split_info = json.load(f)
+    teacher_held_out = bool(split_info.get("holdout")) and split_info.get("eval_fraction") == args.eval_fraction
+    if not teacher_held_out:
+        if not args.allow_seen_teacher:
+            print(f"ERROR: '{TEACHER_MODEL_PATH}' was not trained with --holdout --eval-fraction {args.eval_fraction}, "
+                  "so its held-out scores would be inflated. Retrain it that way, or pass --allow-seen-teacher.")
+            return
+        print("WARNING: The teacher has seen the evaluation split; its F1 in the report is optimistic.")
+
+    with open('TrainingData.json', 'r', encoding='utf-8') as f:
+        examples = json.load(f)
+    train_examples, eval_examples = split_examples(examples, args.eval_fraction)
+    augmented = augment_examples(train_examples, copies=args.augment)
+    print(f"Distillation data: {len(train_examples)} original + {len(augmented)} augmented, {len(eval_examples)} held out.")
+
+    train_set = Dataset.from_list(train_examples + augmented).map(
+        tokenize_and_align_with(tokenizer, tag2id), batched=True, remove_columns=["tokens", "tags"]
+    )
+
+    config = DistilBertConfig(
+        vocab_size=tokenizer.vocab_size, n_layers=args.student_layers, dim=args.student_dim,
+        hidden_dim=args.student_dim * 4, n_heads=args.student_heads,
+        num_labels=len(tag2id), id2label=teacher.config.id2label, label2id=tag2id,
+    )
+    student = DistilBertForTokenClassification(config)
+
+    temperature, alpha = args.temperature, args.alpha
+
+    class DistillationTrainer(Trainer):
+        def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+            labels = inputs.pop("labels")
+            outputs = model(**inputs)
+            teacher.to(outputs.logits.device)   # no-op after the first step
+            with torch.no_grad():
+                teacher_logits = teacher(**inputs).logits
+            mask = labels != -100
+            s_logits, t_logits = outputs.logits[mask], teacher_logits[mask]
+            soft = F.kl_div(
+                F.log_softmax(s_logits / temperature, dim=-1),
+                F.softmax(t_logits / temperature, dim=-1),
+                reduction="batchmean",
+            ) * temperature ** 2
+            hard = F.cross_entropy(s_logits, labels[mask])
+            loss = alpha * soft + (1 - alpha) * hard
+            return (loss, outputs) if return_outputs else loss
+
+    training_args = TrainingArguments(
+        output_dir="form-generator-student-temp",
+        learning_rate=args.learning_rate,
+        per_device_train_batch_size=16,
+        num_train_epochs=args.epochs,
+        weight_decay=0.01,
+        remove_unused_columns=False,
+    )
+    trainer = DistillationTrainer(
+        student, training_args, train_dataset=train_set,
+        data_collator=DataCollatorForTokenClassification(tokenizer=tokenizer), tokenizer=tokenizer,
+    )
+
+    print("--- Starting Distillation ---")
+    trainer.train()
+    trainer.save_model(STUDENT_MODEL_PATH)
+    print(f"Student saved to '{STUDENT_MODEL_PATH}'")
+
+    print("--- Measuring teacher and student ---")
+    teacher.to("cpu"); student.to("cpu")   # latency is reported for CPU inference
+    report = {
+        "student_config": {"layers": args.student_layers, "dim": args.student_dim, "heads": args.student_heads,
+                           "temperature": temperature, "alpha": alpha, "augment": args.augment},
+        "eval_examples": len(eval_examples),
+        "teacher_held_out": teacher_held_out,   # False: the teacher trained on the eval split, its F1 is inflated
+        "teacher": measure_model(teacher, tokenizer, eval_examples, TEACHER_MODEL_PATH),
+        "student": measure_model(student, tokenizer, eval_examples, STUDENT_MODEL_PATH),
+    }
+    t, s = report["teacher"], report["student"]
+    report["summary"] = {
+        "f1_drop": round(t["entity_f1"] - s["entity_f1"], 4),
+        "speedup": round(t["latency_ms"]["mean"] / max(s["latency_ms"]["mean"], 1e-9), 2),
+        "size_ratio": round(s["param_memory_mb"] / max(t["param_memory_mb"], 1e-9), 3),
+    }
+    with open(DISTILL_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'model':<10}{'entity F1':>12}{'mean ms':>10}{'p95 ms':>10}{'params MB':>12}{'disk MB':>10}")
+    for name in ("teacher", "student"):
+        m = report[name]
+        print(f"{name:<10}{m['entity_f1']:>12.4f}{m['latency_ms']['mean']:>10.2f}{m['latency_ms']['p95']:>10.2f}"
+              f"{m['param_memory_mb']:>12.2f}{m['disk_mb']:>10.2f}")
+    print(f"Report written to '{DISTILL_REPORT_PATH}'")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the FormGenerator token classifier.")
+    parser.add_argument("--distill", action="store_true", help="Distil the trained model into a compact student.")
+    parser.add_argument("--holdout", action="store_true", help="Train the teacher without the evaluation split.")
+    parser.add_argument("--student-layers", type=int, default=2)
+    parser.add_argument("--student-dim", type=int, default=256)
+    parser.add_argument("--student-heads", type=int, default=4)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the soft-label loss vs. the gold labels.")
+    parser.add_argument("--augment", type=int, default=2, help="Augmented copies per training example.")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--learning-rate", type=float, default=5e-4)
+    parser.add_argument("--eval-fraction", type=float, default=0.1)
+    parser.add_argument("--allow-seen-teacher", action="store_true",
+                        help="Distil from a teacher not trained with --holdout (its report F1 is then inflated).")
+    cli_args = parser.parse_args()
+
+    if cli_args.distill:
+        distill(cli_args)
+    else:
+        main(holdout=cli_args.holdout, eval_fraction=cli_args.eval_fraction)
@@ -0,0 +1,134 @@
+# ValidationParity.py
+# Checks that the browser's bundle evaluation (frontend/src/src/validation/checkBundle.js, run under
+# Node) and validate_submission agree.
+#   python ValidationParity.py                  -> hand-picked edge cases + 20k random values per field kind
+#   python ValidationParity.py --random 100000  -> more random values
+#   python ValidationParity.py --node /path/to/node
+# Exits non-zero and lists the first disagreements if any value is judged differently. Fields the
+# bundle leaves to the server (serverOnly) only have to avoid errors the server would not give.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+from schema_store import schema_hash
+from validators import RULE_PATTERNS, compile_bundle, validate_submission
+
+RESERVED = ("admin", "test", "root")
+CHECK_BUNDLE_JS = Path(__file__).resolve().parent.parent / "frontend" / "src" / "src" / "validation" / "checkBundle.js"
+NODE_RUNNER = """
+import { checkBundle } from %s;
+let input = '';
+for await (const chunk of process.stdin) input += chunk;
+const { bundle, cases } = JSON.parse(input);
+process.stdout.write(JSON.stringify(cases.map((values) => checkBundle(bundle, values))));
+"""
+
+# User patterns: translatable ones exercise the \\d / \\w / \\s tables, "." and "$"; the rest are
+# Python-only and must come out as serverOnly fields.
+PATTERNS = [
+    r"\s*\w+\s*", r"[^\d\s]+", r"\S+\.\D*", r"\w+$\n?", r"a.c", r"\d{2,4}|x{,2}", r"(?x) \d+ - \d+",
+    r"[é_\-]+\{?", r"(?P<year>\d{4})(?=\d)\d*",
+    r"(?i)admin", r"(?P<c>.)(?P=c)+", r"\bab", r"(?<=a)b+", r"(a)?(?(1)b|c)",
+]
+
+# One field per rule / type the validator distinguishes, plus length limits and a password pair.
+PARITY_SCHEMA = (
+    [{"id": f"RULE_{rule.upper()}", "type": "text", "validation": {"rule": rule}} for rule in RULE_PATTERNS]
+    + [
+        {"id": "USERNAME", "type": "text", "validation": {"rule": "available_username", "required": True}},
+        {"id": "NAME", "type": "text", "validation": {"minLength": 3, "maxLength": 8}},
+        {"id": "AMOUNT", "type": "number", "validation": {}},
+        {"id": "BIRTH_DATE", "type": "date", "validation": {}},
+        {"id": "RATING", "type": "rating", "validation": {"min": 1, "max": 5}},
+        {"id": "SCORE", "type": "rating", "validation": {}},
+        {"id": "COMMENTS", "type": "textarea", "validation": {"maxLength": 20}},
+        {"id": "PASSWORD", "type": "password", "validation": {"required": True, "minLength": 8}},
+        {"id": "CONFIRM_PASSWORD", "type": "password", "validation": {"required": True}},
+    ]
+    + [{"id": f"PATTERN_{i}", "type": "text", "validation": {"pattern": p}} for i, p in enumerate(PATTERNS)]
+)
+
+EDGE_VALUES = [
+    "", " ", "a", "abc", "abcdefgh", "abcdefghi", "ABC123", "abc_123", "héllo", "日本語",
+    "0", "7", "-3", "+4", " 5 ", "5\n", "1_000", "1__0", "_1", "1_", "1.", ".5", "1.5e3", "1e1_0", "1.e5", ".",
+    "inf", "-Infinity", "NaN", "nanx", "١٢٣", "١٢٣٤٥٦٧٨٩٠١", "１２", "12345678901", "1234567890", "123456789012",
+    "4111 1111 1111 1111", "4111111111111", "41111111111111111111", "12/29", "13/29", "01/19", "1/29",
+    "12345-1234567-1", "12345-1234567-12", "a@b.co", "first.last@example-mail.org", "josé@exämple.com",
+    "a@b.c", "@b.co", "a@b.co\n", "2024-02-29", "2023-02-29", "2024-2-9", "2024-02- 9", "0000-01-01",
+    "2024-13-01", "2024-12-31", "2024-12-32", "2024-1-1x", "<b>", "a<b", "a < b > c", "<>", "x<br/>y",
+    "admin", " Admin ", "ROOT", "tester", "password1", "Password1",
+    # Where Python and JavaScript disagree: \d / \w across Unicode versions, \s / strip() (\x1c-\x1f and \x85 vs \ufeff), "." and
+    # "$" around line breaks, int() on other scripts' digits, and int()'s digit limit.
+    "\x1c", "a\x1fb", "\x85", "\ufeff", "admin\ufeff", "admin\x1c", "\u3000admin", "\x85root\x85",
+    "abc\n", "ab\n\n", "a\rc", "a\u2028c", "a\nc", "١_٢", "１_２", "𝟙𝟚", "٣", "2024-0٢-2٩", "１２３４-01-01",
+    "{", "é-_{", "é{{", "AdMiN", "aa", "abab", "bbb", "c", "1234-5", "12345", "12 - 34",
+    "\U00010D40\U00010D41", "x\u1c89y", "\ua7cb",   # digits / letters newer than some Unicode databases
+    "1" * 4300, "1" * 4301, "1_" * 4299 + "1", "1_" * 4300 + "1", "-" + "0" * 4300, " +" + "0" * 4301 + " ",
+]
+ALPHABET = "0123456789 _-+.:/@<>eEaAiInNfFtTyYzZbcx{}\n\t\r" + "١٢٣𝟚" + "é日" + "\x1c\x85\ufeff\u2028\u3000" + "\U00010D42\u1c8a"
+
+
+def random_value(rng):
+    length = rng.choice([0, 1, 2, 3, 5, 8, 11, 13, 16, 20])
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def run_node(node, bundle, cases):
+    """checkBundle(bundle, values) for every case, evaluated by Node."""
+    runner = NODE_RUNNER % json.dumps(CHECK_BUNDLE_JS.as_uri())
+    try:
+        result = subprocess.run([node, "--input-type=module", "-e", runner], input=json.dumps({"bundle": bundle, "cases": cases}),
+                                capture_output=True, text=True, encoding="utf-8")
+    except FileNotFoundError:
+        sys.exit(f"Node.js not found ({node}); pass --node or set NODE.")
+    if result.returncode != 0:
+        sys.exit(f"checkBundle.js failed under Node:\n{result.stderr}")
+    return json.loads(result.stdout)
+
+
+def agrees(server, client, server_only):
+    for fid in server.keys() | client.keys():
+        if fid in server_only and fid not in client: continue   # left to /submit
+        if server.get(fid) != client.get(fid): return False
+    return True
+
+
+def main(random_count, seed, node):
+    bundle = compile_bundle(PARITY_SCHEMA, schema_hash(PARITY_SCHEMA), RESERVED)
+    bundle = json.loads(json.dumps(bundle))   # what the browser receives
+    server_only = {field["id"] for field in bundle["fields"] if field.get("serverOnly")}
+    rng = random.Random(seed)
+    base = {"USERNAME": "someone", "PASSWORD": "secret123", "CONFIRM_PASSWORD": "secret123"}
+
+    cases = []
+    for field in PARITY_SCHEMA:
+        for value in EDGE_VALUES + [random_value(rng) for _ in range(random_count)]:
+            cases.append({**base, field["id"]: value})
+    # Whole-form cases: several fields at once, including the password pair.
+    for _ in range(random_count):
+        cases.append({f["id"]: rng.choice(EDGE_VALUES + [random_value(rng)]) for f in PARITY_SCHEMA if rng.random() < 0.6})
+
+    client_results = run_node(node, bundle, cases)
+    mismatches = []
+    for values, client in zip(cases, client_results):
+        server = validate_submission(values, PARITY_SCHEMA, lambda v: v.strip().lower() in RESERVED, lambda digest: False)
+        if not agrees(server, client, server_only):
+            mismatches.append({"values": values, "server": server, "client": client})
+
+    print(f"{len(cases)} cases, {len(mismatches)} disagreements; left to the server: {', '.join(sorted(server_only)) or 'none'}.")
+    for mismatch in mismatches[:20]:
+        print(json.dumps(mismatch, ensure_ascii=False)[:2000])
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client bundle vs validate_submission parity check.")
+    parser.add_argument("--random", type=int, default=20000, help="Random values per field (and random whole forms).")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--node", default=os.environ.get("NODE", "node"), help="Node.js binary that runs checkBundle.js.")
+    args = parser.parse_args()
+    sys.exit(main(args.random, args.seed, args.node))
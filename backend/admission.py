@@ -0,0 +1,82 @@
+# admission.py
+# Admission control in front of the generation pipeline.
+# Tracks requests in flight and how long recent requests waited for a model replica (a moving
+# average that decays while nothing is observed, so a quiet spell clears it). Past the soft limits
+# requests are admitted degraded (callers skip tier2); past the hard limits they are rejected with
+# a Retry-After estimate, which keeps tail latency bounded for the requests that are accepted.
+import math
+import threading
+import time
+
+from metrics import metrics
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, controller, degraded):
+        self.controller = controller
+        self.degraded = degraded
+        self.started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released: return
+        self._released = True
+        self.controller._release(time.perf_counter() - self.started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, soft_inflight=4, hard_inflight=16, soft_queue_ms=500, hard_queue_ms=3000,
+                 half_life_seconds=5.0, smoothing=0.2):
+        self.soft_inflight = soft_inflight
+        self.hard_inflight = hard_inflight
+        self.soft_queue_ms = soft_queue_ms
+        self.hard_queue_ms = hard_queue_ms
+        self.half_life_seconds = half_life_seconds
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue_ms, self._queue_at = 0.0, time.monotonic()
+        self._service_ms = 0.0
+
+    def _decayed_queue_ms(self):
+        age = time.monotonic() - self._queue_at
+        return self._queue_ms * 0.5 ** (age / self.half_life_seconds)
+
+    def observe_queue(self, wait_ms):
+        """Fed by the model pools with each checkout's wait."""
+        with self._lock:
+            self._queue_ms = self._decayed_queue_ms() * (1 - self.smoothing) + wait_ms * self.smoothing
+            self._queue_at = time.monotonic()
+
+    def admit(self):
+        with self._lock:
+            queue_ms = self._decayed_queue_ms()
+            if self._in_flight >= self.hard_inflight or queue_ms >= self.hard_queue_ms:
+                metrics.incr("admission_rejected")
+                raise Overloaded(max(1, math.ceil(max(queue_ms, self._service_ms) / 1000)))
+            degraded = self._in_flight >= self.soft_inflight or queue_ms >= self.soft_queue_ms
+            self._in_flight += 1
+        metrics.incr("admission_degraded" if degraded else "admission_accepted")
+        return Ticket(self, degraded)
+
+    def _release(self, seconds):
+        with self._lock:
+            self._in_flight -= 1
+            self._service_ms = self._service_ms * (1 - self.smoothing) + seconds * 1000 * self.smoothing
+
+    def snapshot(self):
+        with self._lock:
+            return {"in_flight": self._in_flight, "queue_ms": round(self._decayed_queue_ms(), 1),
+                    "service_ms": round(self._service_ms, 1)}
@@ -1,6 +1,6 @@
 #app2.py:
 from html import entities
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -13,12 +13,34 @@ from rapidfuzz import process
 import re
 import json
 import pytz
-from transformers import pipeline
+from transformers import AutoConfig, pipeline, StoppingCriteria, StoppingCriteriaList
 from textblob import TextBlob
 import os
+import sys
+import hmac
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from gazetteer import Gazetteer
+from embedding_index import load_embedding_index, load_encoder
+from semantic_cache import SemanticCache, cacheable_form
+from schema_store import SchemaStore, schema_hash
+from segment_log import SegmentLog
+from export import EXPORT_FORMATS, PARQUET_AVAILABLE, export_columns, export_chunks
+from submission_stats import SubmissionStats
+from serialization import FastJSONProvider, CatalogPayload, compress_response, dumps
+from metrics import metrics, ratio
+from speculation import Speculation
+from profiling import FunctionProfiler, HeapTracker
+from model_pool import configure_torch_threads, default_thread_counts, load_pool
+from admission import AdmissionController, Overloaded
+from uploads import UploadRejected, UploadStore, read_multipart
+import validators
+import file_lock
+import incremental
+from username_service import UsernameChecker, RESERVED_USERNAMES
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)   # orjson-backed jsonify when orjson is installed
 CORS(app)
 limiter = Limiter(get_remote_address, app=app, default_limits=["100 per hour"])
 
@@ -28,8 +50,62 @@ print("Model loaded.")
 
 DATA_FOLDER = "data"
 os.makedirs(DATA_FOLDER, exist_ok=True)   # <-- move this up here
-FORMS_FILE = os.path.join(DATA_FOLDER, "forms.json")
-SUBMISSIONS_FILE = os.path.join(DATA_FOLDER, "submissions.json")
+FORMS_FILE = os.path.join(DATA_FOLDER, "forms.json")              # legacy, imported into FORMS_LOG_DIR
+SUBMISSIONS_FILE = os.path.join(DATA_FOLDER, "submissions.json")  # legacy, imported into SUBMISSIONS_LOG_DIR
+SCHEMAS_FILE = os.path.join(DATA_FOLDER, "schemas.json")
+FORMS_LOG_DIR = os.path.join(DATA_FOLDER, "forms")
+SUBMISSIONS_LOG_DIR = os.path.join(DATA_FOLDER, "submissions")
+REJECTIONS_LOG_DIR = os.path.join(DATA_FOLDER, "rejections")    # failing field IDs of rejected submissions, for stats
+UPLOADS_DIR = os.path.join(DATA_FOLDER, "uploads")
+# Size cap for file fields whose validation rules set no maxSizeMB.
+UPLOAD_DEFAULT_MAX_MB = float(os.environ.get("UPLOAD_DEFAULT_MAX_MB", "25"))
+
+# Segmented logs roll over at whichever limit comes first; sealed segments are compressed in the background.
+LOG_SEGMENT_MB = float(os.environ.get("LOG_SEGMENT_MB", "16"))
+LOG_SEGMENT_HOURS = float(os.environ.get("LOG_SEGMENT_HOURS", "24"))
+LOG_COMPRESSION = os.environ.get("LOG_COMPRESSION", "gzip")   # "gzip" or "zstd" (needs zstandard)
+
+# Share of a prompt's content words the tier-0 gazetteer must recognise before it skips tier1.
+TIER0_MIN_COVERAGE = float(os.environ.get("TIER0_MIN_COVERAGE", "0.75"))
+# Cosine similarity a template / field must reach in the embedding index before tier2 is skipped.
+SEMANTIC_TEMPLATE_THRESHOLD = float(os.environ.get("SEMANTIC_TEMPLATE_THRESHOLD", "0.60"))
+SEMANTIC_FIELD_THRESHOLD = float(os.environ.get("SEMANTIC_FIELD_THRESHOLD", "0.55"))
+USE_INT8_INDEX = os.environ.get("USE_INT8_INDEX", "0") == "1"
+# Tier2 starts alongside tier1 when tier1's early confidence estimate falls below this (0 disables).
+TIER2_SPECULATION_THRESHOLD = float(os.environ.get("TIER2_SPECULATION_THRESHOLD", "0.5"))
+TIER2_SPECULATION_WORKERS = int(os.environ.get("TIER2_SPECULATION_WORKERS", "2"))
+# Unchanged chunks on each side of an edit that are re-classified with it (incremental /process).
+INCREMENTAL_CONTEXT_CHUNKS = int(os.environ.get("INCREMENTAL_CONTEXT_CHUNKS", "3"))
+# Worker processes serving the app (gunicorn -w); they share data/ through file locks.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+# Inference pool: replicas per model (sharing weights) and process-wide Torch thread counts.
+# Intra-op threads default to cores / (WEB_CONCURRENCY x replicas); BenchmarkModelPool.py suggests values.
+MODEL_REPLICAS = int(os.environ.get("MODEL_REPLICAS", "1"))
+TORCH_INTRA_OP_THREADS = int(os.environ.get("TORCH_INTRA_OP_THREADS", "0")) or default_thread_counts(
+    MODEL_REPLICAS, WEB_CONCURRENCY)
+TORCH_INTER_OP_THREADS = int(os.environ.get("TORCH_INTER_OP_THREADS", "1"))
+# Generation requests in flight / average wait for a model replica: past the soft limits tier2 is
+# skipped and the response is flagged "degraded"; past the hard limits requests get 503 + Retry-After.
+ADMISSION_SOFT_INFLIGHT = int(os.environ.get("ADMISSION_SOFT_INFLIGHT", "4"))
+ADMISSION_HARD_INFLIGHT = int(os.environ.get("ADMISSION_HARD_INFLIGHT", "16"))
+ADMISSION_SOFT_QUEUE_MS = float(os.environ.get("ADMISSION_SOFT_QUEUE_MS", "500"))
+ADMISSION_HARD_QUEUE_MS = float(os.environ.get("ADMISSION_HARD_QUEUE_MS", "3000"))
+# Saved forms are served again for prompts at least this similar to the one that produced them.
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "2000"))
+SEMANTIC_CACHE_MAX_AGE_DAYS = float(os.environ.get("SEMANTIC_CACHE_MAX_AGE_DAYS", "30"))
+# JSON responses at least this large are gzip/brotli-compressed for clients that accept it.
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+# User service backing the `available_username` rule; unset means only the reserved names are taken.
+USER_SERVICE_URL = os.environ.get("USER_SERVICE_URL", "")
+USERNAME_CHECK_TIMEOUT = float(os.environ.get("USERNAME_CHECK_TIMEOUT", "0.5"))   # seconds /submit will wait
+USERNAME_CHECK_CONCURRENCY = int(os.environ.get("USERNAME_CHECK_CONCURRENCY", "10"))
+USERNAME_AVAILABLE_TTL = float(os.environ.get("USERNAME_AVAILABLE_TTL", "30"))
+USERNAME_TAKEN_TTL = float(os.environ.get("USERNAME_TAKEN_TTL", "600"))
+USERNAME_CACHE_SIZE = int(os.environ.get("USERNAME_CACHE_SIZE", "10000"))
+# /admin/* routes only exist when ADMIN_TOKEN is set; callers send it as X-Admin-Token.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILE_DIR = os.path.join(DATA_FOLDER, "profiles")
 
 
 
@@ -48,6 +124,40 @@ def write_json(file_path, data):
         json.dump(data, f, indent=4, ensure_ascii=False)
 
 
+# The logs and schema table are shared between workers with fcntl locks; without them, one worker only.
+if WEB_CONCURRENCY > 1 and not file_lock.LOCKING:
+    print("FATAL: WEB_CONCURRENCY > 1 needs fcntl file locks, which this platform lacks. Run a single worker.")
+    exit(1)
+
+# Schemas are stored once in SCHEMAS_FILE; forms and submissions reference them by hash.
+schema_store = SchemaStore(SCHEMAS_FILE)
+
+def open_log(directory, ts_field, legacy_file, kind, tag_field=None):
+    log = SegmentLog(directory, ts_field=ts_field, max_segment_bytes=int(LOG_SEGMENT_MB * 2**20),
+                     max_segment_seconds=LOG_SEGMENT_HOURS * 3600, codec=LOG_COMPRESSION, tag_field=tag_field)
+
+    def migrate_inline_schemas(records):
+        records, migrated = schema_store.migrate_records(records, kind)
+        if migrated:
+            print(f"Migrated {migrated} {kind} records in {legacy_file} to schema hashes.")
+        return records
+
+    # Every worker gets here at startup; the log's lock lets exactly one of them import the file.
+    imported = log.import_legacy(legacy_file, read_json, convert=migrate_inline_schemas)
+    if imported:
+        print(f"Imported {imported} records from {legacy_file} into {directory}.")
+    return log
+
+forms_log = open_log(FORMS_LOG_DIR, "created_at", FORMS_FILE, "form")
+submissions_log = open_log(SUBMISSIONS_LOG_DIR, "timestamp", SUBMISSIONS_FILE, "submission", tag_field="schema_hash")
+
+rejections_log = SegmentLog(REJECTIONS_LOG_DIR, max_segment_bytes=int(LOG_SEGMENT_MB * 2**20),
+                            max_segment_seconds=LOG_SEGMENT_HOURS * 3600, codec=LOG_COMPRESSION, tag_field="schema_hash")
+
+# Per-form aggregates are folded from the shared logs on request, so every worker reports the same numbers.
+submission_stats = SubmissionStats(submissions_log, rejections_log)
+
+
 # --- Data Loading Function ---
 def load_knowledge_base(fields_path, templates_path):
     try:
@@ -83,12 +193,21 @@ def make_dynamic_def(id_str):
             options=[]
         )
 
-
 # --- The Form Generator Engine ---
 
 
+class CancelledCriteria(StoppingCriteria):
+    # Ends a speculative tier2 generation as soon as its result is no longer wanted.
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
 class FormGenerator:
-    def __init__(self, fields_data, templates_data):
+    def __init__(self, fields_data, templates_data, queue_observer=None):
         field_definitions = [FieldDefinition(**data) for data in fields_data]
         self.field_map = {f.id: f for f in field_definitions}
         self.fuzzy_map = {kw.lower(): f.id for f in field_definitions for kw in f.fuzzy_keywords}
@@ -96,11 +215,23 @@ class FormGenerator:
             self.fuzzy_map[field.label.lower()] = field.id
             
         self.form_templates = self._resolve_template_aliases(templates_data)
+        self.gazetteer = Gazetteer(self.fuzzy_map, self.form_templates, templates_data)
+        self.embedding_index = load_embedding_index(use_int8=USE_INT8_INDEX)
+
+        intra_op, inter_op = configure_torch_threads(TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS)
+        print(f"Torch threads: intra-op={intra_op}, inter-op={inter_op}.")
 
         model_path = "./FormGeneratorModel"
         print(f"Loading fine-tuned model from: {model_path}")
         try:
-            self.classifier = pipeline("token-classification", model=model_path, aggregation_strategy="simple")
+            self.classifier = load_pool(
+                "classifier",
+                lambda: pipeline("token-classification", model=model_path, aggregation_strategy="simple"),
+                "token-classification", replicas=MODEL_REPLICAS,
+                on_wait=queue_observer, aggregation_strategy="simple"
+            )
+            # Entity groups the classifier can emit; edited-prompt sessions may only carry these.
+            self.entity_labels = {label.split("-", 1)[-1] for label in AutoConfig.from_pretrained(model_path).id2label.values()} - {"O"}
             print("Hugging Face model loaded successfully.")
         except Exception as e:
             print(f"FATAL: Could not load Hugging Face model. Error: {e}")
@@ -109,13 +240,18 @@ class FormGenerator:
         # ─── TIER 2: off‑the‑shelf FLAN‑T5‑Large few‑shot fallback ────────────
         print("Loading base FLAN‑T5‑Large for Tier 2 fallback…")
         try:
-            self.seq2seq = pipeline(
+            self.seq2seq = load_pool(
+            "seq2seq",
+            lambda: pipeline(
             "text2text-generation",
             model="google/flan-t5-large",
             tokenizer="google/flan-t5-large",
             device=-1,              # forces CPU
             max_new_tokens=64,      # use the newer argument name
             do_sample=False
+            ),
+            "text2text-generation", replicas=MODEL_REPLICAS,
+            on_wait=queue_observer, device=-1, max_new_tokens=64, do_sample=False
             )
 
             print("✅ Loaded google/flan-t5-large")
@@ -123,6 +259,7 @@ class FormGenerator:
             print(f"FATAL: could not load FLAN‑T5‑Large. Error: {e}")
             exit(1)
         # ────────────────────────────────────────────────────────────────────
+        self.tier2_pool = ThreadPoolExecutor(max_workers=TIER2_SPECULATION_WORKERS, thread_name_prefix="tier2")
 
 
     def _resolve_template_aliases(self, templates):
@@ -137,12 +274,111 @@ class FormGenerator:
                 if "seeds" not in value: value["seeds"] = []
         return resolved
     
-    def tier1(self, prompt: str):
+    def tier0(self, prompt: str):
+        match, reason = self.gazetteer.resolve(prompt, TIER0_MIN_COVERAGE)
+        if not match:
+            print(f"DEBUG: Tier 0 fell through: {reason}.")
+            return None
+
+        final_fields_map = {}
+        for fid in match["field_ids"]:
+            if fid in self.field_map and fid not in final_fields_map:
+                final_fields_map[fid] = copy.deepcopy(self.field_map[fid])
+        if match["template"]:
+            for item in self.form_templates.get(match["template"], {}).get("fields", []):
+                fid = item.get('id') if isinstance(item, dict) else item
+                if fid in self.field_map and fid not in final_fields_map:
+                    final_fields_map[fid] = copy.deepcopy(self.field_map[fid])
+        for fid in match["removed"]:
+            final_fields_map.pop(fid, None)
+        if not final_fields_map:
+            return None
+
+        print(f"DEBUG: Tier 0 matched template={match['template']} fields={list(final_fields_map)} (coverage {match['coverage']:.2f}).")
+        return list(final_fields_map.values()), match["template"] or "custom"
+
+    def best_seed(self, text):
+        # Best fuzzy seed match across all templates, as (score, template) or (0, None).
+        best_score, best_key = 0, None
+        for key, template in self.form_templates.items():
+            seeds = template.get("seeds", [])
+            if not seeds: continue
+            match_tuple = process.extractOne(text, seeds, score_cutoff=90)
+            if match_tuple and match_tuple[1] > best_score:
+                best_score, best_key = match_tuple[1], key
+        return best_score, best_key
+
+    def tier1_confidence(self, prompt, entities, seed_score=0):
+        # Rough 0..1 guess that tier1 will return fields. `entities` are gazetteer hits (no scores)
+        # before the classifier has run and model entities after it.
+        groups = [e.get("entity_group") for e in entities]
+        if "RATING" in groups or re.search(r"\b(rating|rate|score)\b", prompt, re.IGNORECASE):
+            return 1.0   # rating prompts always produce at least the RATING field
+        form_type = max((float(e.get("score", 1.0)) for e in entities if e.get("entity_group") == "FORM_TYPE"), default=0.0)
+        field_scores = [float(e.get("score", 1.0)) for e in entities if e.get("entity_group") == "FIELD_NAME"]
+        fields = sum(field_scores) / len(field_scores) * min(len(field_scores), 2) / 2 if field_scores else 0.0
+        words = len(prompt.split())
+        return max(form_type, fields, seed_score / 100) * (1.0 if 2 <= words <= 30 else 0.8)
+
+    def tier1(self, prompt: str, speculation=None, previous=None):
+        for stage, payload in self.tier1_stages(prompt, speculation, previous):
+            if stage == "result":
+                return payload
+
+    def analyze(self, prompt, previous=None):
+        # (corrected prompt, entities, template to keep). With `previous` (the session of the prompt
+        # this one edits) only the edited chunks are re-corrected and re-classified.
+        if previous:
+            try:
+                analysis = self.reanalyze(prompt, previous)
+            except (KeyError, TypeError, ValueError, IndexError):
+                analysis = None
+            if analysis:
+                return analysis
+            metrics.incr("incremental_fallbacks")
         corrected_prompt = str(TextBlob(prompt).correct())
+        return corrected_prompt, [incremental.plain_entity(e) for e in self.classifier(corrected_prompt)], None
+
+    def reanalyze(self, prompt, previous):
+        plan = incremental.plan_edit(previous, prompt, self.entity_labels)
+        if plan is None:
+            return None
+        pieces = [piece if piece is not None else str(TextBlob(prompt[start:end]).correct())
+                  for piece, (start, end) in zip(plan["pieces"], plan["raw_spans"])]
+        corrected_prompt, spans = incremental.rebuild(prompt, plan["raw_spans"], pieces)
+        new_start, new_end, old_start, old_end, shift = incremental.reclassify_window(
+            plan, spans, len(corrected_prompt), INCREMENTAL_CONTEXT_CHUNKS)
+        window = corrected_prompt[new_start:new_end]
+        window_entities = [incremental.plain_entity(e, new_start) for e in self.classifier(window)] if window.strip() else []
+        entities = incremental.merge_entities(plan["old_entities"], window_entities, old_start, old_end, shift)
+
+        # The template stays when the FORM_TYPE span it came from is untouched and no new one appeared.
+        template, span = None, plan["template_entity"]
+        if (plan["template"] in self.form_templates and isinstance(span, list) and len(span) == 2
+                and (span[1] <= old_start or span[0] >= old_end)
+                and not any(e.get("entity_group") == "FORM_TYPE" for e in window_entities)):
+            template = plan["template"]
+            metrics.incr("incremental_template_reuse")
+        metrics.incr("incremental_runs")
+        print(f"DEBUG: Incremental tier1, re-classified '{window}' ({len(window)}/{len(corrected_prompt)} chars).")
+        return corrected_prompt, entities, template
+
+    def tier1_stages(self, prompt: str, speculation=None, previous=None):
+        # tier1 as a generator: ("template", (name, base_defs)) once the template is settled,
+        # ("fields", (added_defs, removed_ids)) after entity resolution, ("session", state) for the
+        # next edit of this prompt (see analyze), then ("result", (defs, name)).
+        if speculation:
+            speculation.consider(self.tier1_confidence(prompt, self.gazetteer.scan(prompt)[1]))
+        corrected_prompt, entities, kept_template = self.analyze(prompt, previous)
         if corrected_prompt != prompt:
             print(f"Spell-corrected prompt: '{prompt}' -> '{corrected_prompt}'")
-        entities = self.classifier(corrected_prompt)
         print(f"Model Entities Found: {entities}")
+        has_form_type_entity = any(e.get('entity_group') == 'FORM_TYPE' for e in entities)
+        seed_match = None
+        if speculation:
+            # The seed score feeds the estimate and is reused by the seed fallback below.
+            seed_match = None if has_form_type_entity else self.best_seed(corrected_prompt)
+            speculation.consider(self.tier1_confidence(corrected_prompt, entities, seed_match[0] if seed_match else 0))
 
         def get_field_id_from_word(word):
             candidates = list(self.fuzzy_map.keys()) + list(self.field_map.keys())
@@ -151,8 +387,17 @@ class FormGenerator:
                 return self.fuzzy_map.get(match_tuple[0]) or (match_tuple[0] if match_tuple[0] in self.field_map else None)
             return None
 
+        def field_id_for(entity):
+            # Entities kept from the previous run carry the id they resolved to then.
+            cached = entity.get("field_id", "")
+            if cached is None or cached in self.field_map:
+                return cached
+            entity["field_id"] = get_field_id_from_word(entity["word"])
+            return entity["field_id"]
+
         final_fields_map = {}
         detected_template_names = []
+        template_entity = None
         
         rating_min, rating_max = 1, 7
         rating_range_found = False
@@ -177,7 +422,6 @@ class FormGenerator:
         if not is_explicit_rating_command:
             is_short = len(corrected_prompt.split()) < 8
             mentions_rating_keyword = bool(re.search(r"\b(rating|rate|score|field)\b", corrected_prompt, re.IGNORECASE))
-            has_form_type_entity = any(e.get('entity_group') == 'FORM_TYPE' for e in entities)
             if is_short and mentions_rating_keyword and not has_form_type_entity:
                 is_heuristic_rating_match = True
 
@@ -199,27 +443,24 @@ class FormGenerator:
         else:
             # BRANCH 2: This is a full form, so search for a template.
             # First, try to match based on a FORM_TYPE entity.
-            form_type_entities = [e['word'] for e in entities if e.get('entity_group') == 'FORM_TYPE']
-            if form_type_entities:
-                entity_word = form_type_entities[0]
+            form_type_entities = [e for e in entities if e.get('entity_group') == 'FORM_TYPE']
+            if form_type_entities and kept_template:
+                detected_template_names.append(kept_template)
+                template_entity = [form_type_entities[0]['start'], form_type_entities[0]['end']]
+                print(f"DEBUG: Kept template '{kept_template}', its FORM_TYPE entity was not edited.")
+            elif form_type_entities:
+                entity_word = form_type_entities[0]['word']
                 match = process.extractOne(entity_word, self.form_templates.keys(), score_cutoff=85)
                 if match:
                     tid = match[0]
                     detected_template_names.append(tid)
+                    template_entity = [form_type_entities[0]['start'], form_type_entities[0]['end']]
                     print(f"DEBUG: Matched template '{tid}' via FORM_TYPE entity '{entity_word}'.")
 
             # If no entity match, fall back to fuzzy matching seeds.
             if not detected_template_names:
                 print("DEBUG: No FORM_TYPE entity found. Falling back to fuzzy matching seeds.")
-                best_score, best_key = 0, None
-                for key, template in self.form_templates.items():
-                    seeds = template.get("seeds", [])
-                    if not seeds: continue
-                    
-                    match_tuple = process.extractOne(corrected_prompt, seeds, score_cutoff=90)
-                    if match_tuple and match_tuple[1] > best_score:
-                        best_score, best_key = match_tuple[1], key
-                
+                best_score, best_key = seed_match or self.best_seed(corrected_prompt)
                 if best_key:
                     detected_template_names.append(best_key)
                     print(f"DEBUG: Matched template '{best_key}' via fuzzy seed matching.")
@@ -236,11 +477,14 @@ class FormGenerator:
                             field_obj.validation['min'] = rating_min
                             field_obj.validation['max'] = rating_max
                         final_fields_map[fid] = field_obj
-        
+
+        base_ids = list(final_fields_map)
+        yield "template", (detected_template_names[0] if detected_template_names else "custom", list(final_fields_map.values()))
+
         field_entities = sorted([e for e in entities if e.get('entity_group') == 'FIELD_NAME'], key=lambda x: x['start'])
         ordered_field_ids = []
         for field_entity in field_entities:
-            field_id = get_field_id_from_word(field_entity['word'])
+            field_id = field_id_for(field_entity)
             if field_id:
                 if field_id not in final_fields_map:
                     if field_id in self.field_map:
@@ -256,12 +500,14 @@ class FormGenerator:
             potential_targets = [fe for fe in field_entities if fe['start'] > neg_entity['end']]
             if not potential_targets: continue
             closest_field_entity = min(potential_targets, key=lambda fe: fe['start'] - neg_entity['end'])
-            field_id_to_remove = get_field_id_from_word(closest_field_entity['word'])
+            field_id_to_remove = field_id_for(closest_field_entity)
             if field_id_to_remove: fields_to_remove.add(field_id_to_remove)
         for field_id in fields_to_remove:
             final_fields_map.pop(field_id, None)
             if field_id in ordered_field_ids: ordered_field_ids.remove(field_id)
-        
+        yield "fields", ([d for fid, d in final_fields_map.items() if fid not in base_ids],
+                         [fid for fid in base_ids if fid not in final_fields_map])
+
         # --- FINAL ASSEMBLY ---
         # `final_fields_map` now contains the correct FieldDefinition objects with correct validation.
         # We now create a sorted list of these objects.
@@ -279,10 +525,35 @@ class FormGenerator:
                 processed_ids.add(fid)
 
         final_template = detected_template_names[0] if detected_template_names else "custom"
-        return final_ordered_objects, final_template
+        yield "session", {"prompt": prompt, "corrected": corrected_prompt, "entities": entities,
+                          "template": detected_template_names[0] if template_entity else None,
+                          "template_entity": template_entity}
+        yield "result", (final_ordered_objects, final_template)
+
 
+    def semantic_match(self, prompt: str):
+        # Nearest template seed / field keywords in the precomputed index; empty when nothing is close.
+        if not self.embedding_index:
+            return [], "custom"
+        templates, fields = self.embedding_index.lookup(prompt, k=6)
+        print(f"DEBUG: Semantic candidates: templates={templates[:3]} fields={fields[:3]}")
 
-    def tier2(self, prompt: str):
+        if templates and templates[0][2] >= SEMANTIC_TEMPLATE_THRESHOLD:
+            tid = templates[0][0]
+            defs = []
+            for item in self.form_templates.get(tid, {}).get("fields", []):
+                fid = item.get('id') if isinstance(item, dict) else item
+                if fid in self.field_map and all(d.id != fid for d in defs):
+                    defs.append(copy.deepcopy(self.field_map[fid]))
+            if defs:
+                return defs, tid
+
+        picked = [fid for fid, _, score in fields if score >= SEMANTIC_FIELD_THRESHOLD and fid in self.field_map]
+        if len(picked) >= 2:
+            return [copy.deepcopy(self.field_map[fid]) for fid in picked], "custom"
+        return [], "custom"
+
+    def tier2(self, prompt: str, cancel_event=None):
         instruction = (
             "### FORM GENERATOR INSTRUCTIONS:\n"
             "- You will be given a REQUEST describing the form the user wants.\n"
@@ -306,10 +577,15 @@ class FormGenerator:
             f"REQUEST: {prompt}\n"
             "FIELDS:"
         )
+        generate_kwargs = {}
+        if cancel_event is not None:
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([CancelledCriteria(cancel_event)])
         try:
-            out = self.seq2seq(instruction)[0]["generated_text"]
+            out = self.seq2seq(instruction, **generate_kwargs)[0]["generated_text"]
         except Exception as e:
             print(f"Tier 2 model failed: {e}"); return [], "custom"
+        if cancel_event is not None and cancel_event.is_set():
+            return [], "custom"
         
         raw_ids = []
         match = re.search(r"\[.*?\]", out, re.DOTALL)
@@ -340,16 +616,109 @@ class FormGenerator:
         return final_defs, "custom"
 
 
-    def process_prompt(self, prompt: str):
-        # `tier1` and `tier2` now both return a list of FieldDefinition objects
-        fields, template = self.tier1(prompt)
-        if not fields:
-            return self.tier2(prompt)
-        return fields, template
+    def process_prompt(self, prompt: str, allow_tier2=True, previous=None):
+        # Every tier returns a list of FieldDefinition objects and a template name.
+        for stage, payload in self.process_prompt_stages(prompt, allow_tier2, previous):
+            if stage == "result":
+                return payload
+
+    def process_prompt_stages(self, prompt: str, allow_tier2=True, previous=None):
+        # Intermediate tier1 stages as they settle, ("refining", None) before tier2 runs, then ("result", ...).
+        # With allow_tier2=False (shedding load) a tier1 / semantic miss ends with an empty result.
+        result = self.tier0(prompt)
+        if result:
+            metrics.incr("tier0_hits")
+            yield "result", result
+            return
+        metrics.incr("tier0_misses")
+
+        speculation = None
+        if allow_tier2 and TIER2_SPECULATION_THRESHOLD > 0:
+            speculation = Speculation(self.tier2_pool, lambda cancel_event: self.tier2(prompt, cancel_event),
+                                      TIER2_SPECULATION_THRESHOLD)
+
+        for stage, payload in self.tier1_stages(prompt, speculation, previous):
+            if stage == "result":
+                fields, template = payload
+            else:
+                yield stage, payload
+        if fields:
+            if speculation: speculation.cancel()
+            yield "result", (fields, template)
+            return
+
+        fields, template = self.semantic_match(prompt)
+        if fields:
+            if speculation: speculation.cancel()
+            metrics.incr("semantic_hits")
+            yield "result", (fields, template)
+            return
+        if not allow_tier2:
+            metrics.incr("tier2_skipped")
+            yield "result", (fields, template)
+            return
+        metrics.incr("tier2_calls")
+        yield "refining", None
+        if speculation and speculation.started and not speculation.cancel_event.is_set():
+            yield "result", speculation.result()
+            return
+        if speculation:
+            metrics.incr("speculation_missed")
+        yield "result", self.tier2(prompt)
+
+# Client-facing catalogs are serialized and compressed once per knowledge-base load.
+def build_catalogs(fields_data, templates_data):
+    fields = [
+        {"id": f["id"], "label": f["label"], "type": f["type"],
+         "validation": f.get("validation") or {}, "options": f.get("options") or []}
+        for f in fields_data
+    ]
+    templates = {k: v for k, v in templates_data.items() if isinstance(v, dict)}
+    aliases = {k: v for k, v in templates_data.items() if isinstance(v, str)}
+    return {"fields": CatalogPayload(fields), "templates": CatalogPayload({"templates": templates, "aliases": aliases})}
+
+upload_store = UploadStore(UPLOADS_DIR, UPLOAD_DEFAULT_MAX_MB)
 
 # --- Main Application Setup ---
 fields_data, templates_data = load_knowledge_base('fields.json', 'templates.json')
-form_gen = FormGenerator(fields_data, templates_data)
+catalogs = build_catalogs(fields_data, templates_data)
+admission = AdmissionController(ADMISSION_SOFT_INFLIGHT, ADMISSION_HARD_INFLIGHT,
+                                ADMISSION_SOFT_QUEUE_MS, ADMISSION_HARD_QUEUE_MS)
+form_gen = FormGenerator(fields_data, templates_data, queue_observer=admission.observe_queue)
+
+
+def build_semantic_cache():
+    encode = form_gen.embedding_index.encode if form_gen.embedding_index else None
+    if encode is None:
+        try:
+            encode = load_encoder()
+        except (ImportError, OSError) as e:
+            print(f"WARNING: Semantic cache disabled, no sentence encoder available ({e}).")
+            return None
+    cache = SemanticCache(encode, {f["id"]: f for f in fields_data}, form_gen.form_templates,
+                          max_entries=SEMANTIC_CACHE_SIZE,
+                          max_age_seconds=SEMANTIC_CACHE_MAX_AGE_DAYS * 24 * 3600,
+                          threshold=SEMANTIC_CACHE_THRESHOLD)
+    saved_forms = [schema_store.hydrate_form(record) for record in forms_log.read()]
+    print(f"Semantic cache warmed with {cache.warm(saved_forms)} saved forms.")
+    return cache
+
+semantic_cache = build_semantic_cache()
+
+
+def build_username_checker():
+    if not USER_SERVICE_URL:
+        return None
+    try:
+        return UsernameChecker(USER_SERVICE_URL, timeout=USERNAME_CHECK_TIMEOUT,
+                               max_concurrency=USERNAME_CHECK_CONCURRENCY,
+                               available_ttl=USERNAME_AVAILABLE_TTL, taken_ttl=USERNAME_TAKEN_TTL,
+                               cache_max_entries=USERNAME_CACHE_SIZE)
+    except ImportError as e:
+        print(f"WARNING: Username service disabled, httpx is not installed ({e}).")
+        return None
+
+username_checker = build_username_checker()
 
 @app.route("/process", methods=["POST"])
 @limiter.limit("2 per second")
@@ -362,124 +731,391 @@ def process_prompt_route():
     if not cleaned or cleaned.isdigit():
         return jsonify({"error": "Prompt is empty or invalid. Please provide some text."}), 400
 
-    # `process_prompt` now returns the final, configured list of FieldDefinition objects.
-    generated_defs, template_name = form_gen.process_prompt(prompt)
-    
-    if not generated_defs:
-        return jsonify({"title": "Could not generate form", "prompt": prompt, "fields": [], "template": "none", "message": "I couldn't understand the type of form you want. Try being more specific, like 'a contact form' or 'an internship application form'."})
-        
-    # All redundant logic is removed. We now simply convert the final objects to dictionaries for the JSON response.
-    schema = [
+    if (cached := cached_form(prompt, cleaned)):
+        return jsonify(cached)
+    metrics.incr("cache_misses")
+
+    try:
+        ticket = admission.admit()
+    except Overloaded as e:
+        return overloaded_response(e)
+    # "previous": the "session" returned for the prompt this one edits; only the edit is re-analysed.
+    previous = data.get("previous") if isinstance(data.get("previous"), dict) else None
+    session = None
+    with ticket:
+        for stage, payload in form_gen.process_prompt_stages(prompt, allow_tier2=not ticket.degraded, previous=previous):
+            if stage == "session":
+                session = payload
+            elif stage == "result":
+                generated_defs, template_name = payload
+    return jsonify(generated_form(prompt, generated_defs, template_name, ticket.degraded, session))
+
+def cached_form(prompt, cleaned):
+    # /process body for a semantic cache hit, or None; a saved form whose rules cannot be compiled
+    # is skipped so the prompt goes through the normal pipeline instead.
+    if not semantic_cache or not (hit := semantic_cache.lookup(cleaned)):
+        return None
+    form, similarity, cached_prompt = hit
+    try:
+        bundle = validator_bundles.get(form.get("fields") or [])
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"WARNING: Skipping cached form for '{cached_prompt}', its validators do not compile ({e}).")
+        metrics.incr("cache_invalid")
+        return None
+    metrics.incr("cache_hits")
+    print(f"DEBUG: Semantic cache hit ({similarity:.3f}) on saved prompt '{cached_prompt}'.")
+    return {**form, "prompt": prompt, "source": "cache",
+            "cache_similarity": round(similarity, 4), "cached_prompt": cached_prompt, "validators": bundle}
+
+def overloaded_response(error):
+    response = jsonify({"error": "The server is busy. Please try again shortly.", "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+def field_schema(defs):
+    return [
         {
             "id": f.id, "label": f.label, "type": f.type,
             "validation": f.validation, "options": f.options
         }
-        for f in generated_defs
+        for f in defs
     ]
 
-    return jsonify({
-        "title": "Generated Form",
-        "prompt": prompt,
-        "template": template_name,
-        "fields": schema
-    })
+def generated_form(prompt, generated_defs, template_name, degraded=False, session=None):
+    # `degraded`: tier2 was skipped under load, so a miss may have been answerable with more capacity.
+    # `session`: tier1's analysis, sent back as "previous" with the next edit of this prompt.
+    if not generated_defs:
+        body = {"title": "Could not generate form", "prompt": prompt, "fields": [], "template": "none", "source": "generated", "message": "I couldn't understand the type of form you want. Try being more specific, like 'a contact form' or 'an internship application form'."}
+    else:
+        schema = field_schema(generated_defs)
+        body = {
+            "title": "Generated Form",
+            "prompt": prompt,
+            "template": template_name,
+            "fields": schema,
+            "source": "generated",
+            "validators": validator_bundles.get(schema)
+        }
+    if degraded:
+        body["degraded"] = True
+    if session:
+        body["session"] = session
+    return body
 
-# --- SERVER-SIDE VALIDATION HELPER (Unchanged) ---
-def validate_submission(values: dict, schema: list):
-    errors = {}
-    for field in schema:
-        fid   = field["id"]
-        rules = field.get("validation", {})
-        val   = values.get(fid, "")
-
-        if rules.get("required") and not val:
-            errors[fid] = "This field is required."
-            continue
-        if not val: continue
-
-        if "minLength" in rules and len(val) < rules["minLength"]: errors[fid] = f"Must be at least {rules['minLength']} characters."
-        if "maxLength" in rules and len(val) > rules["maxLength"]: errors[fid] = f"Must be no more than {rules['maxLength']} characters."
-        if (p := rules.get("pattern")) and not re.fullmatch(p, val): errors[fid] = "Invalid format."
-        
-        rule = rules.get("rule")
-        if rule == "email_format" and not re.fullmatch(r"^[\w\.-]+@[\w\.-]+\.[A-Za-z]{2,}$", val): errors[fid] = "Must be a valid email address."
-        elif rule == "phone_number" and not re.fullmatch(r"\d{11}", val): errors[fid] = "Must be exactly 11 digits."
-        elif rule == "credit_card_format" and not re.fullmatch(r"\d{13,19}", val.replace(" ", "")): errors[fid] = "Must be 13–19 digits (spaces allowed)."
-        elif rule == "expiry_format" and not re.fullmatch(r"(0[1-9]|1[0-2])\/([2-9]\d)", val): errors[fid] = "Must be in MM/YY format."
-        elif rule == "national_id" and not re.fullmatch(r"\d{5}-\d{7}-\d", val): errors[fid] = "Invalid National ID format."
-        elif rule == "alphanumeric" and not re.fullmatch(r"[A-Za-z0-9]+", val): errors[fid] = "Only letters and numbers allowed."
-        elif rule == "available_username" and val.lower() in ("admin","test","root"): errors[fid] = "Username is already taken."
-        
-        if "PASSWORD" in values and "CONFIRM_PASSWORD" in values and values["PASSWORD"] != values["CONFIRM_PASSWORD"]:
-            errors["CONFIRM_PASSWORD"] = "Passwords do not match."
+def sse_event(event, data):
+    return b"event: " + event.encode("ascii") + b"\ndata: " + dumps(data) + b"\n\n"
 
-        try:
-            if field.get("type") == "number": float(val)
-            elif field.get("type") == "date": from datetime import datetime; datetime.strptime(val, "%Y-%m-%d")
-        except ValueError: errors[fid] = f"Must be a valid {field.get('type')}."
-        
-        if field.get("type") == "rating" and val:
-            try:
-                r, mn, mx = int(val), rules.get("min",1), rules.get("max",7)
-                if r < mn or r > mx: errors[fid] = f"Rating must be between {mn} and {mx}."
-            except ValueError: errors[fid] = "Rating must be a number."
+# Same pipeline as /process, streamed as Server-Sent Events while each stage finishes:
+#   template   {"template", "fields"}        base fields as soon as the template is matched
+#   fields     {"added", "removed"}          changes from entity resolution
+#   refining   {}                            nothing matched yet; tier 2 is generating
+#   schema     same body as /process         final form (a "refinement" instead when tier 2 produced it)
+#                                            ("previous" is accepted as on /process)
+#   done       {}
+@app.route("/process/stream", methods=["POST"])
+@limiter.limit("2 per second")
+def process_prompt_stream_route():
+    data = request.get_json()
+    if not data or not (prompt := data.get("prompt")):
+        return jsonify({"error": "Prompt is empty or invalid request"}), 400
+    cleaned = prompt.strip()
+    if not cleaned or cleaned.isdigit():
+        return jsonify({"error": "Prompt is empty or invalid. Please provide some text."}), 400
+
+    if (cached := cached_form(prompt, cleaned)):
+        return Response([sse_event("schema", cached), sse_event("done", {})], mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+    metrics.incr("cache_misses")
+
+    # Admitted before the stream starts, so overload is still a plain 503; the ticket is held until it ends.
+    try:
+        ticket = admission.admit()
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    previous = data.get("previous") if isinstance(data.get("previous"), dict) else None
+
+    def events():
+        with ticket:
+            final_event, session = "schema", None
+            for stage, payload in form_gen.process_prompt_stages(prompt, allow_tier2=not ticket.degraded, previous=previous):
+                if stage == "template":
+                    template_name, base_defs = payload
+                    yield sse_event("template", {"template": template_name, "fields": field_schema(base_defs)})
+                elif stage == "fields":
+                    added, removed = payload
+                    if added or removed:
+                        yield sse_event("fields", {"added": field_schema(added), "removed": removed})
+                elif stage == "refining":
+                    final_event = "refinement"
+                    yield sse_event("refining", {})
+                elif stage == "session":
+                    session = payload
+                elif stage == "result":
+                    yield sse_event(final_event, generated_form(prompt, *payload, ticket.degraded, session))
+        yield sse_event("done", {})
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(ticket.release)   # the generator body never runs if the client leaves first
+    return response
+
+@app.route("/templates", methods=["GET"])
+@limiter.exempt
+def templates_route():
+    return catalogs["templates"].respond()
+
+@app.route("/fields", methods=["GET"])
+@limiter.exempt
+def fields_route():
+    return catalogs["fields"].respond()
+
+@app.after_request
+def compress_json(response):
+    return compress_response(response, COMPRESS_MIN_BYTES)
 
-        if re.search(r"<[^>]+>", val): errors[fid] = "HTML tags are not allowed."
-    return errors
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    counters = metrics.snapshot()
+    counters["tier0_hit_rate"] = ratio(counters.get("tier0_hits", 0), counters.get("tier0_misses", 0))
+    counters["cache_hit_rate"] = ratio(counters.get("cache_hits", 0), counters.get("cache_misses", 0))
+    counters["semantic_hit_rate"] = ratio(counters.get("semantic_hits", 0), counters.get("tier2_calls", 0))
+    counters["admission"] = admission.snapshot()
+    counters["speculation_useful_rate"] = ratio(counters.get("speculation_useful", 0), counters.get("speculation_wasted", 0))
+    counters["incremental_template_reuse_rate"] = ratio(counters.get("incremental_template_reuse", 0),
+                                                        counters.get("incremental_runs", 0) - counters.get("incremental_template_reuse", 0))
+    return jsonify(counters)
+
+def username_taken(username):
+    if username_checker is None:
+        return username.strip().lower() in RESERVED_USERNAMES
+    # None means the service did not answer in time; the submission is not held up for it.
+    return username_checker.is_available(username) is False
+
+# Lets the frontend check while the user types, which also warms the cache /submit reads.
+@app.route("/username_available", methods=["GET"])
+@limiter.limit("5 per second")
+def username_available_route():
+    username = request.args.get("username", "").strip()
+    if not username:
+        return jsonify({"error": "username is required"}), 400
+    if username_checker is None:
+        return jsonify({"username": username, "available": username.lower() not in RESERVED_USERNAMES})
+    return jsonify({"username": username, "available": username_checker.is_available(username)})
+
+# --- SERVER-SIDE VALIDATION HELPER ---
+# The rules themselves live in validators.py, which also compiles them into the client bundle.
+def validate_submission(values: dict, schema: list, staged_digests=()):
+    # `staged_digests`: files uploaded with this very request, committed only if it validates.
+    if username_checker is not None:
+        # All username fields are looked up concurrently before the per-field loop waits on any of them.
+        username_checker.prefetch(values.get(f["id"], "") for f in schema
+                                  if (f.get("validation") or {}).get("rule") == "available_username")
+    return validators.validate_submission(values, schema, username_taken,
+                                          lambda digest: isinstance(digest, str) and (digest in staged_digests or upload_store.exists(digest)))
+
+validator_bundles = validators.BundleCache(schema_hash, RESERVED_USERNAMES)
+
+# Client-side validation bundle for a saved form (the /process output already carries one).
+@app.route("/forms/<schema_hash>/validators", methods=["GET"])
+@limiter.exempt
+def validators_route(schema_hash):
+    schema = schema_store.get(schema_hash)
+    if schema is None:
+        return jsonify({"error": "Unknown form."}), 404
+    try:
+        return jsonify(validator_bundles.get(schema))
+    except ValueError as e:
+        return jsonify({"error": f"This form cannot be validated in the browser: {e}"}), 422
 
 # Save generated form
 @app.route("/save_form", methods=["POST"])
 def save_form():
     form_schema = request.get_json(force=True)
 
-    # Append to forms.json
-    append_json(FORMS_FILE, {
+    # Append to the forms log; the field list itself goes to the schema table once.
+    digest, form_meta = schema_store.dehydrate_form(form_schema)
+    forms_log.append({
         "created_at": datetime.utcnow().isoformat(),
-        "schema": form_schema
+        "schema_hash": digest,
+        "form": form_meta
     })
 
-    return jsonify({"success": True, "message": "Form schema saved."})
+    # Accepted forms answer future prompts that mean the same thing.
+    if semantic_cache and isinstance(form_schema, dict) and isinstance(form_schema.get("prompt"), str) \
+            and (form := cacheable_form(form_schema, semantic_cache.catalog, semantic_cache.template_names)):
+        semantic_cache.add(form_schema["prompt"], form)
 
+    return jsonify({"success": True, "message": "Form schema saved.", "schema_hash": digest})
 
 
-def append_json(file_path, new_entry):
-    """Append an entry to a JSON array file, creating it if it doesn't exist."""
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-    else:
-        data = []
-    
-    data.append(new_entry)
-    
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
 
 @app.route("/submit", methods=["POST"])
 @limiter.limit("5 per minute")
 def submit_route():
-    payload = request.get_json(force=True)
-    values, schema = payload.get("values", {}), payload.get("schema", [])
-    
+    staged = []
+    try:
+        if request.mimetype == "multipart/form-data":
+            values, schema, staged = read_multipart_submission()
+        else:
+            values, schema = submission_schema(request.get_json(force=True))
+    except UploadRejected as e:
+        return jsonify({"success": False, "errors": {e.field_id: str(e)}}), e.status
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
     print(">>> /submit values:", values)
     print(">>> /submit schema:", [f['id'] + ":" + str(f.get('validation')) for f in schema])
     
-    errs = validate_submission(values, schema)
+    try:
+        errs = validate_submission(values, schema, {writer.digest for writer in staged})
+    except BaseException:
+        upload_store.discard_staged(staged)
+        raise
     if errs:
+        upload_store.discard_staged(staged)
+        # Only forms already stored get failure stats; arbitrary rejected schemas are not tracked.
+        if schema_store.get(digest := schema_hash(schema)) is not None:
+            submission_stats.record_failure(digest, errs)
         return jsonify({"success": False, "errors": errs}), 400
     
-    # Save submission
+    # Save submission; the validated schema is interned and referenced by hash.
+    upload_store.commit_staged(staged)
+    digest = schema_store.intern(schema)
     submission_entry = {
         "timestamp": datetime.utcnow().isoformat(),
         "values": values,
-        "schema": schema
+        "schema_hash": digest
     }
-    append_json(SUBMISSIONS_FILE, submission_entry)
+    submissions_log.append(submission_entry)
     
-    return jsonify({"success": True, "message": "Form submitted successfully."})
+    return jsonify({"success": True, "message": "Form submitted successfully.", "schema_hash": digest})
+
+def submission_schema(payload):
+    if not isinstance(payload, dict):
+        raise ValueError("The submission must be a JSON object.")
+    values, schema = payload.get("values", {}), payload.get("schema")
+    # Clients that already know the schema's hash (from /save_form or an earlier submit) can send just that.
+    if schema is None and payload.get("schema_hash"):
+        schema = schema_store.get(payload["schema_hash"])
+        if schema is None:
+            raise ValueError("Unknown schema_hash.")
+    schema = schema or []
+    if not isinstance(values, dict):
+        raise ValueError("values must be an object of field id -> value.")
+    validators.check_schema(schema)
+    return values, schema
+
+# multipart/form-data submit: a "payload" part holding the usual JSON body comes first, then one
+# file part per file field, named by field id. Files stream to a staging area and `values` gets their
+# references; returns (values, schema, staged writers) for submit_route to commit or discard.
+def read_multipart_submission():
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        raise ValueError("Missing multipart boundary.")
+    parsed = {}
+
+    def on_field(name, text):
+        if name == "payload":
+            parsed["values"], parsed["schema"] = submission_schema(json.loads(text))
+
+    def open_file(name, filename, headers):
+        if "schema" not in parsed:
+            raise UploadRejected(name, "The payload part must come before any file.")
+        field = next((f for f in parsed["schema"] if f.get("id") == name), None)
+        if field is None or field.get("type") != "file":
+            raise UploadRejected(name, "This field does not accept files.")
+        return upload_store.writer(name, filename, headers.get("Content-Type"), field.get("validation") or {})
+
+    files, staged = read_multipart(request.stream, boundary, on_field, open_file)
+    if "schema" not in parsed:
+        raise ValueError("Missing payload part.")
+    return {**parsed["values"], **files}, parsed["schema"], staged
+
+# Stream a form's submissions; `start` / `end` are ISO timestamps (end exclusive). Admin only:
+# schema hashes are easy to obtain, and submissions hold personal data.
+@app.route("/forms/<schema_hash>/export", methods=["GET"])
+def export_submissions_route(schema_hash):
+    if (denied := admin_denied()):
+        return denied
+    schema = schema_store.get(schema_hash)
+    if schema is None:
+        return jsonify({"error": "Unknown form."}), 404
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}."}), 400
+    if fmt == "parquet" and not PARQUET_AVAILABLE:
+        return jsonify({"error": "Parquet export needs pyarrow installed on the server."}), 400
+
+    # Time range and form are applied inside the log (segment / block skipping); rows are never buffered.
+    records = submissions_log.read(request.args.get("start"), request.args.get("end"), tag=schema_hash)
+    return Response(
+        stream_with_context(export_chunks(fmt, records, export_columns(schema))),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="submissions-{schema_hash[:12]}.{fmt}"'},
+    )
+
+@app.route("/forms/<schema_hash>/stats", methods=["GET"])
+def submission_stats_route(schema_hash):
+    if (denied := admin_denied()):
+        return denied
+    stats = submission_stats.get(schema_hash, schema_store.get(schema_hash))
+    if stats is None:
+        return jsonify({"error": "Unknown form."}), 404
+    return jsonify(stats)
+
+# --- Admin: on-demand profiling ---
+# Only these functions are ever wrapped, and only while a session is running.
+profiler = FunctionProfiler(PROFILE_DIR)
+profiler.register(form_gen, "tier1_stages", "tier1")
+profiler.register(form_gen, "tier2")
+profiler.register(sys.modules[__name__], "validate_submission")
+heap_tracker = HeapTracker(PROFILE_DIR)
+
+def admin_denied():
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found."}), 404
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Forbidden."}), 403
+    return None
+
+# POST {"mode": "cprofile"|"sample", "count": N, "sample_every": K, "interval_ms": ms} arms a session;
+# it ends by itself after N selected calls, or early with DELETE. Dumps land in PROFILE_DIR.
+@app.route("/admin/profile", methods=["GET", "POST", "DELETE"])
+def admin_profile_route():
+    if denied := admin_denied(): return denied
+    if request.method == "POST":
+        options = request.get_json(silent=True) or {}
+        try:
+            session = profiler.start(mode=options.get("mode", "cprofile"), count=int(options.get("count", 10)),
+                                     sample_every=int(options.get("sample_every", 1)),
+                                     interval_ms=float(options.get("interval_ms", 5)))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"success": True, "session": session})
+    if request.method == "DELETE":
+        return jsonify({"success": True, "dump": profiler.stop()})
+    return jsonify(profiler.status())
+
+# POST {"action": "start"} sets the heap baseline, "snapshot" reports growth since then, "stop" ends tracing.
+@app.route("/admin/heap", methods=["GET", "POST"])
+def admin_heap_route():
+    if denied := admin_denied(): return denied
+    if request.method == "GET":
+        return jsonify(heap_tracker.status())
+    options = request.get_json(silent=True) or {}
+    action = options.get("action")
+    if action == "start":
+        return jsonify(heap_tracker.start())
+    if action == "stop":
+        return jsonify(heap_tracker.stop())
+    if action == "snapshot":
+        try:
+            return jsonify(heap_tracker.growth(top=int(options.get("top", 20))))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"error": "action must be start, snapshot or stop."}), 400
 
 if __name__ == "__main__":
     os.makedirs("data", exist_ok=True)
@@ -0,0 +1,88 @@
+# embedding_index.py
+# Request-time side of the semantic index written by BuildEmbeddingIndex.py.
+# The matrix is memory-mapped, so every worker shares the same pages and a lookup is a
+# single matrix-vector product followed by a partial sort.
+import json
+import os
+
+import numpy as np
+
+INDEX_DIR = "embeddings"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def index_paths(index_dir=INDEX_DIR):
+    return {
+        "matrix": os.path.join(index_dir, "index_f32.npy"),
+        "int8": os.path.join(index_dir, "index_int8.npy"),
+        "scale": os.path.join(index_dir, "index_scale.npy"),
+        "meta": os.path.join(index_dir, "index_meta.json"),
+    }
+
+
+def load_encoder(model_name=EMBEDDING_MODEL):
+    """`encode(texts) -> (n, dim) float32`, L2-normalized so dot products are cosine similarities."""
+    from sentence_transformers import SentenceTransformer
+    encoder = SentenceTransformer(model_name, device="cpu")
+
+    def encode(texts):
+        return encoder.encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+    return encode
+
+
+class EmbeddingIndex:
+    def __init__(self, index_dir=INDEX_DIR, use_int8=False):
+        paths = index_paths(index_dir)
+        with open(paths["meta"], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.model_name = meta["model"]
+        self.entries = meta["entries"]
+        self.use_int8 = use_int8 and os.path.exists(paths["int8"])
+        if self.use_int8:
+            self.matrix = np.load(paths["int8"], mmap_mode="r")
+            self.scale = np.load(paths["scale"])
+        else:
+            self.matrix = np.load(paths["matrix"], mmap_mode="r")
+            self.scale = None
+        self.kinds = np.array([e["kind"] for e in self.entries])
+        self.encode = load_encoder(self.model_name)
+
+    def scores(self, vector):
+        """Cosine similarity of `vector` (already normalized) against every row."""
+        if self.scale is not None:
+            return (self.matrix @ vector) * self.scale
+        return self.matrix @ vector
+
+    def top_k(self, scores, kind, k=5):
+        """Best `k` distinct ids of one kind as (id, matched_text, score), best first."""
+        masked = np.where(self.kinds == kind, scores, -np.inf)
+        # Over-fetch: several rows (seeds/keywords) usually point at the same id.
+        n = min(len(masked), k * 8)
+        if n == 0:
+            return []   # empty index
+        candidates = np.argpartition(-masked, n - 1)[:n]
+        results, seen = [], set()
+        for row in candidates[np.argsort(-masked[candidates])]:
+            if not np.isfinite(masked[row]): break
+            entry = self.entries[row]
+            if entry["id"] in seen: continue
+            seen.add(entry["id"])
+            results.append((entry["id"], entry["text"], float(masked[row])))
+            if len(results) == k: break
+        return results
+
+    def lookup(self, text, k=5):
+        vector = self.encode([text])[0]
+        scores = self.scores(vector)
+        return self.top_k(scores, "template", k), self.top_k(scores, "field", k)
+
+
+def load_embedding_index(index_dir=INDEX_DIR, use_int8=False):
+    """The index is optional: without it the server keeps the string-similarity path only."""
+    try:
+        index = EmbeddingIndex(index_dir, use_int8=use_int8)
+        print(f"Embedding index loaded: {len(index.entries)} rows ({'int8' if index.use_int8 else 'float32'}).")
+        return index
+    except (FileNotFoundError, ImportError, KeyError, json.JSONDecodeError) as e:
+        print(f"WARNING: Semantic index disabled ({e}). Run BuildEmbeddingIndex.py to enable it.")
+        return None
@@ -0,0 +1,123 @@
+# entity_linking.py
+# Steps 2-5 of app.py's FormGenerator.process_prompt: turn the classifier's FIELD_NAME, NEGATION,
+# QUANTITY and ATTRIBUTE entities into field definitions.
+# Entities are sorted by offset once and every FIELD_NAME word is resolved to a field ID once; the
+# negation / quantity / attribute links are bisect lookups on those offset-sorted lists. Ties go the
+# way the original linear min() scans broke them, i.e. to the entity the model returned first.
+import copy
+from bisect import bisect_left, bisect_right
+
+NUM_MAP = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+ORDINAL_MAP = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "former": 1, "latter": -1}
+QUANTITY_MAX_GAP = 20   # characters between a QUANTITY's end and the field it applies to
+
+
+def link_entities(prompt, entities, final_fields_map, field_map, resolve_field):
+    """Add, drop, multiply and mark required the fields in `final_fields_map` (updated in place).
+    `resolve_field(word)` maps a FIELD_NAME word to a field ID or None. Returns the mentioned field
+    IDs in prompt order, without the negated or multiplied ones."""
+    # --- Setup ---
+    # sorted() is stable, so entities with the same start keep the model's order.
+    field_entities = sorted((e for e in entities if e.get('entity_group') == 'FIELD_NAME'), key=lambda x: x['start'])
+    field_starts = [fe['start'] for fe in field_entities]
+    resolved_words = {}
+    for fe in field_entities:
+        if fe['word'] not in resolved_words:
+            resolved_words[fe['word']] = resolve_field(fe['word'])
+    field_entity_ids = [resolved_words[fe['word']] for fe in field_entities]
+
+    ordered_field_ids, mentioned = [], set()
+    for field_id in field_entity_ids:
+        if field_id:
+            if field_id not in final_fields_map:
+                final_fields_map[field_id] = copy.deepcopy(field_map[field_id])
+            if field_id not in mentioned:
+                mentioned.add(field_id)
+                ordered_field_ids.append(field_id)
+    dropped_ids = set()   # negated or expanded IDs, filtered out of ordered_field_ids after step 4
+
+    # --- Deletions ---
+    # A negation removes the first field that starts after it ends.
+    fields_to_remove = set()
+    for neg_entity in (e for e in entities if e.get('entity_group') == 'NEGATION'):
+        i = bisect_right(field_starts, neg_entity['end'])
+        if i < len(field_entities) and field_entity_ids[i]:
+            fields_to_remove.add(field_entity_ids[i])
+
+    for field_id in fields_to_remove:
+        final_fields_map.pop(field_id, None)
+        dropped_ids.add(field_id)
+
+    # --- Quantities ---
+    # A field takes the closest QUANTITY ending before it, if that is under QUANTITY_MAX_GAP characters
+    # away; of several ending at the same offset, the one the model returned first.
+    quantified_fields_info = {}
+    quant_entities = sorted((e for e in entities if e.get('entity_group') == 'QUANTITY'), key=lambda x: x['end'])
+    quant_ends = [q['end'] for q in quant_entities]
+
+    for field_entity, field_id_base in zip(field_entities, field_entity_ids):
+        if not field_id_base or field_id_base not in final_fields_map: continue
+
+        i = bisect_left(quant_ends, field_entity['start']) - 1
+        if i < 0 or field_entity['start'] - quant_ends[i] >= QUANTITY_MAX_GAP: continue
+        quant_entity = quant_entities[bisect_left(quant_ends, quant_ends[i])]
+        num_word = quant_entity['word'].lower()
+        num = int(num_word) if num_word.isdigit() else NUM_MAP.get(num_word, 1)
+
+        if num > 1:
+            original_field = final_fields_map.pop(field_id_base)
+            dropped_ids.add(field_id_base)
+
+            quantified_fields_info[field_id_base] = []
+            for i in range(num):
+                field_id = f"{field_id_base}_{i+1}"
+                field_def = copy.deepcopy(original_field)
+                field_def.id, field_def.label = field_id, f"{original_field.label} {i+1}"
+                final_fields_map[field_id] = field_def
+                quantified_fields_info[field_id_base].append(field_id)
+
+    ordered_field_ids = [fid for fid in ordered_field_ids if fid not in dropped_ids]
+
+    # --- Attributes ---
+    # Applied in the model's order, so the last attribute on a field wins as before.
+    for attr_entity in (e for e in entities if e.get('entity_group') == 'ATTRIBUTE'):
+        is_optional = "optional" in attr_entity['word'].lower() or "not" in attr_entity['word'].lower() or "don't" in attr_entity['word'].lower()
+        target_id = None
+
+        # Priority 1: Check for explicit ordinals/positionals
+        search_window = prompt[max(0, attr_entity['start'] - 25): attr_entity['end'] + 25].lower()
+        ordinal_found = None
+        for word, index in ORDINAL_MAP.items():
+            if word in search_window:
+                ordinal_found = index
+                break
+
+        # Link positional to the ordered list of mentioned fields
+        if ordinal_found and ordered_field_ids:
+            if ordinal_found == -1: # Handle "latter"
+                target_id = ordered_field_ids[-1]
+            elif ordinal_found > 0 and ordinal_found <= len(ordered_field_ids):
+                target_id = ordered_field_ids[ordinal_found - 1]
+
+        # Priority 2: Fallback to proximity-based linking (nearest start, earlier one on a tie)
+        if not target_id:
+            if not field_entities: continue
+            i = bisect_left(field_starts, attr_entity['start'])
+            if i == len(field_entities):
+                closest = bisect_left(field_starts, field_starts[i - 1])
+            elif i == 0:
+                closest = i
+            else:
+                left = bisect_left(field_starts, field_starts[i - 1])
+                closest = left if attr_entity['start'] - field_starts[left] <= field_starts[i] - attr_entity['start'] else i
+            target_id = field_entity_ids[closest]
+
+        # Apply the modification
+        if target_id and target_id in final_fields_map:
+            final_fields_map[target_id].validation['required'] = not is_optional
+        elif target_id in quantified_fields_info: # Apply to all quantified fields if base is targeted
+            for q_id in quantified_fields_info[target_id]:
+                if q_id in final_fields_map:
+                    final_fields_map[q_id].validation['required'] = not is_optional
+
+    return ordered_field_ids
@@ -0,0 +1,118 @@
+# export.py
+# Generators that turn a stream of submission records into CSV / JSONL / Parquet bytes.
+# Nothing here holds more than one row (or one Parquet row group) in memory.
+import csv
+import io
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARQUET_AVAILABLE = pq is not None
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+PARQUET_ROW_GROUP = 10000
+CHUNK_BYTES = 64 * 1024
+
+
+def export_columns(schema):
+    return ["timestamp"] + [field["id"] for field in schema if field.get("id")]
+
+
+def _cell(value):
+    if value is None: return ""
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def _row(record, columns):
+    values = record.get("values", {})
+    return [record.get("timestamp", "")] + [_cell(values.get(fid)) for fid in columns[1:]]
+
+
+def csv_chunks(records, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0); buffer.truncate()
+        return data.encode("utf-8")
+
+    writer.writerow(columns)
+    yield drain()   # header goes out before the first record is read
+    for record in records:
+        writer.writerow(_row(record, columns))
+        if buffer.tell() >= CHUNK_BYTES:
+            yield drain()
+    yield drain()
+
+
+def jsonl_chunks(records, columns):
+    lines, size = [], 0
+    for record in records:
+        line = (json.dumps(dict(zip(columns, _row(record, columns))), ensure_ascii=False) + "\n").encode("utf-8")
+        lines.append(line); size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(lines)
+            lines, size = [], 0
+    yield b"".join(lines)
+
+
+class _ChunkSink:
+    """Write-only file object that hands whatever ParquetWriter wrote back to the generator."""
+
+    def __init__(self):
+        self.chunks, self.position, self.closed = [], 0, False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def parquet_chunks(records, columns, row_group=PARQUET_ROW_GROUP):
+    schema = pa.schema([(name, pa.string()) for name in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    batch = [[] for _ in columns]
+
+    def flush_batch():
+        writer.write_table(pa.table([pa.array(col, pa.string()) for col in batch], schema=schema))
+        for col in batch: col.clear()
+
+    for record in records:
+        for col, value in zip(batch, _row(record, columns)):
+            col.append(value)
+        if len(batch[0]) >= row_group:
+            flush_batch()
+            yield sink.drain()
+    if batch[0]:
+        flush_batch()
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(fmt, records, columns):
+    if fmt == "csv": return csv_chunks(records, columns)
+    if fmt == "jsonl": return jsonl_chunks(records, columns)
+    return parquet_chunks(records, columns)
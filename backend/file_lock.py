@@ -0,0 +1,43 @@
+# file_lock.py
+# Cross-process locks for the files several app workers (WEB_CONCURRENCY > 1) write to.
+# Uses fcntl.flock; where fcntl is missing (Windows) only the in-process lock applies, so the
+# app must run as a single worker there.
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCKING = fcntl is not None
+
+
+class FileLock:
+    """Exclusive lock held by one thread of one process at a time, on `path` (created if missing)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = open(path, "a+b")
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+def try_lock(f):
+    """Non-blocking exclusive lock on an open file, released when it is closed; False if someone else has it."""
+    if not fcntl:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
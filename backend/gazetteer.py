@@ -0,0 +1,172 @@
+# gazetteer.py
+# Tier 0: dictionary lookup over the knowledge base with an Aho-Corasick automaton.
+# One linear pass over the prompt finds every template seed, field keyword and
+# negation/quantity cue; FormGenerator only trusts the result when it covers the prompt.
+import re
+from collections import deque
+
+NEGATION_WORDS = ["without", "no", "not", "except", "excluding", "exclude", "remove", "minus", "skip",
+                  "omit", "leave out", "don't include", "do not include", "don't need", "do not need"]
+QUANTITY_WORDS = ["one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+                  "couple", "several", "multiple", "few"]
+# Cues that tier1 turns into a dedicated RATING field; tier 0 leaves those prompts to tier1.
+RATING_WORDS = ["rating", "rate", "score"]
+# Words that carry no field information, so they neither help nor hurt coverage.
+FILLER_WORDS = {
+    "a", "an", "the", "form", "forms", "page", "with", "and", "or", "for", "of", "to", "in", "on", "my", "our",
+    "i", "we", "need", "want", "please", "create", "make", "build", "generate", "give", "me", "us", "simple",
+    "basic", "new", "just", "only", "also", "field", "fields", "box", "boxes", "section", "that", "has", "have",
+    "include", "including", "add", "but", "some", "your", "their", "required", "optional", "mandatory", ",",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+
+def normalize(text):
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+class AhoCorasick:
+    """Multi-pattern matcher; `search` reports (start, end, payload) for every occurrence in one pass."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add(self, pattern, payload):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({}); self.fail.append(0); self.out.append([])
+            node = nxt
+        self.out[node].append((len(pattern), payload))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+        return self
+
+    def search(self, text):
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for length, payload in self.out[node]:
+                yield i + 1 - length, i + 1, payload
+
+
+class Gazetteer:
+    def __init__(self, fuzzy_map, form_templates, templates_data):
+        self.automaton = AhoCorasick()
+        self.ambiguous_seeds = set()
+        seen = {}
+
+        def add(phrase, payload, canonical=False):
+            phrase = normalize(phrase)
+            if not phrase: return
+            if phrase in seen:
+                # The same seed under two different templates can't be decided by lookup alone,
+                # unless the phrase is literally one of the template keys.
+                if payload[0] == "FORM_TYPE" and seen[phrase][0] == "FORM_TYPE" and phrase not in canonical_phrases \
+                        and form_templates.get(seen[phrase][1]) is not form_templates.get(payload[1]):
+                    self.ambiguous_seeds.add(phrase)
+                return
+            if canonical: canonical_phrases.add(phrase)
+            seen[phrase] = payload
+            self.automaton.add(phrase, payload)
+
+        canonical_phrases = set()
+        # Order decides ties: rating cues first (tier1 owns them), then template keys and seeds
+        # ("feedback" the form, not the field), then field keywords, then the modifier lexicon.
+        for word in RATING_WORDS:
+            add(word, ("RATING", word))
+        for key in templates_data:
+            add(key.replace("_", " "), ("FORM_TYPE", key), canonical=True)
+        for key, value in templates_data.items():
+            if isinstance(value, dict):
+                for seed in value.get("seeds", []):
+                    add(seed, ("FORM_TYPE", key))
+        for keyword, field_id in fuzzy_map.items():
+            if normalize(keyword) not in FILLER_WORDS:
+                add(keyword, ("FIELD_NAME", field_id))
+        for word in NEGATION_WORDS:
+            add(word, ("NEGATION", word))
+        for word in QUANTITY_WORDS:
+            add(word, ("QUANTITY", word))
+        self.automaton.build()
+
+    def scan(self, prompt):
+        """Leftmost-longest, word-aligned, non-overlapping matches plus the share of content words they cover."""
+        text = normalize(prompt)
+        word_starts, word_ends = set(), set()
+        for m in re.finditer(r"\S+", text):
+            word_starts.add(m.start()); word_ends.add(m.end())
+
+        candidates = [(start, end, payload) for start, end, payload in self.automaton.search(text)
+                      if start in word_starts and end in word_ends]
+        candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+        entities, cursor = [], 0
+        for start, end, (group, value) in candidates:
+            if start < cursor: continue
+            entities.append({"entity_group": group, "value": value, "word": text[start:end], "start": start, "end": end})
+            cursor = end
+
+        content = covered = idx = 0
+        for m in re.finditer(r"\S+", text):
+            if m.group() in FILLER_WORDS: continue
+            content += 1
+            while idx < len(entities) and entities[idx]["end"] < m.end():
+                idx += 1
+            if idx < len(entities) and entities[idx]["start"] <= m.start():
+                covered += 1
+        coverage = covered / content if content else 0.0
+        return text, entities, coverage
+
+    def resolve(self, prompt, min_coverage):
+        """Tier-0 reading of the prompt, or (None, reason) when tier1 has to decide."""
+        text, entities, coverage = self.scan(prompt)
+        groups = [e["entity_group"] for e in entities]
+        if "RATING" in groups or "QUANTITY" in groups or re.search(r"\d", text):
+            return None, "needs tier1 (rating/quantity)"
+        if coverage < min_coverage:
+            return None, f"coverage {coverage:.2f} < {min_coverage}"
+
+        templates = [e for e in entities if e["entity_group"] == "FORM_TYPE"]
+        if any(e["word"] in self.ambiguous_seeds for e in templates):
+            return None, "ambiguous template seed"
+        if len({e["value"] for e in templates}) > 1:
+            return None, "several templates mentioned"
+
+        field_ids, removed = [], []
+        pending_negation = False
+        for e in entities:
+            if e["entity_group"] == "NEGATION":
+                pending_negation = True
+            elif e["entity_group"] == "FIELD_NAME":
+                (removed if pending_negation else field_ids).append(e["value"])
+                pending_negation = False
+        if pending_negation:
+            return None, "negation without a target"
+        if not templates and not field_ids:
+            return None, "nothing recognised"
+
+        return {
+            "template": templates[0]["value"] if templates else None,
+            "field_ids": field_ids,
+            "removed": removed,
+            "coverage": coverage,
+            "entities": entities,
+        }, "ok"
@@ -0,0 +1,132 @@
+# incremental.py
+# Bookkeeping for re-running tier1 on an edited prompt.
+# Prompts are compared as whitespace-separated chunks. TextBlob corrects every word on its own, so a
+# chunk that did not change keeps its previous correction, and only the edited chunks plus a few
+# chunks of context on each side go back through the corrector and the classifier. Entities found
+# outside that window are carried over from the previous run, shifted to their new offsets.
+# The previous session comes back from the client, so its entities are checked and normalised like
+# fresh classifier output before any of them is reused.
+import math
+import re
+
+
+def plain_entity(entity, offset=0):
+    """Classifier output as JSON-safe session data, offsets moved into the full corrected prompt."""
+    return {"entity_group": entity.get("entity_group"), "word": entity.get("word", ""),
+            "start": int(entity["start"]) + offset, "end": int(entity["end"]) + offset,
+            "score": round(float(entity.get("score", 1.0)), 4)}
+
+
+def session_entity(entity, text_len, labels):
+    """A client-supplied session entity in plain_entity's shape (plus its field_id), or None if malformed."""
+    if not isinstance(entity, dict):
+        return None
+    start, end, score = entity.get("start"), entity.get("end"), entity.get("score", 1.0)
+    if not (isinstance(start, int) and isinstance(end, int) and 0 <= start <= end <= text_len
+            and isinstance(entity.get("word"), str) and isinstance(entity.get("entity_group"), str)
+            and entity["entity_group"] in labels
+            and isinstance(score, (int, float)) and not isinstance(score, bool) and math.isfinite(score)):
+        return None
+    clean = plain_entity(entity)
+    if "field_id" in entity:
+        if entity["field_id"] is not None and not isinstance(entity["field_id"], str):
+            return None
+        clean["field_id"] = entity["field_id"]
+    return clean
+
+
+def chunk_spans(text):
+    return [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]
+
+
+def rebuild(raw, raw_spans, pieces):
+    """`raw` with chunk i replaced by pieces[i], whitespace kept; returns (text, spans of the pieces)."""
+    out, spans, pos, cursor = [], [], 0, 0
+    for (start, end), piece in zip(raw_spans, pieces):
+        out.append(raw[cursor:start])
+        pos += start - cursor
+        spans.append((pos, pos + len(piece)))
+        out.append(piece)
+        pos += len(piece)
+        cursor = end
+    out.append(raw[cursor:])
+    return "".join(out), spans
+
+
+def _shared_chunks(old, old_spans, new, new_spans):
+    """(p, q): leading / trailing chunks that are identical, along with the whitespace next to them."""
+    def before(text, spans, i): return text[spans[i - 1][1] if i else 0:spans[i][0]]
+    def after(text, spans, i): return text[spans[i][1]:spans[i + 1][0] if i + 1 < len(spans) else len(text)]
+
+    limit = min(len(old_spans), len(new_spans))
+    p = 0
+    while p < limit and (old[old_spans[p][0]:old_spans[p][1]], before(old, old_spans, p)) == \
+            (new[new_spans[p][0]:new_spans[p][1]], before(new, new_spans, p)):
+        p += 1
+    q = 0
+    while q < limit - p:
+        i, j = len(old_spans) - 1 - q, len(new_spans) - 1 - q
+        if (old[old_spans[i][0]:old_spans[i][1]], after(old, old_spans, i)) != \
+                (new[new_spans[j][0]:new_spans[j][1]], after(new, new_spans, j)):
+            break
+        q += 1
+    return p, q
+
+
+def plan_edit(previous, prompt, labels):
+    """What survives of `previous` (the session a tier1 run returned) when the prompt becomes `prompt`.
+    `labels` are the classifier's entity groups. None when the session is unusable (any malformed
+    entity discards all of it); otherwise a plan whose `pieces` are None for chunks to re-correct."""
+    old_prompt, old_corrected = previous["prompt"], previous["corrected"]
+    if not isinstance(old_prompt, str) or not isinstance(old_corrected, str) or not isinstance(previous["entities"], list):
+        return None
+    old_raw_spans, old_spans = chunk_spans(old_prompt), chunk_spans(old_corrected)
+    if len(old_raw_spans) != len(old_spans):
+        return None
+    entities = [session_entity(e, len(old_corrected), labels) for e in previous["entities"]]
+    if None in entities:
+        return None
+
+    raw_spans = chunk_spans(prompt)
+    p, q = _shared_chunks(old_prompt, old_raw_spans, prompt, raw_spans)
+    old_pieces = [old_corrected[s:e] for s, e in old_spans]
+    pieces = old_pieces[:p] + [None] * (len(raw_spans) - p - q) + (old_pieces[len(old_pieces) - q:] if q else [])
+    return {"raw_spans": raw_spans, "pieces": pieces, "p": p, "q": q,
+            "old_corrected": old_corrected, "old_spans": old_spans, "old_entities": entities,
+            "template": previous.get("template"), "template_entity": previous.get("template_entity")}
+
+
+def _char_range(spans, a, b, text_len):
+    start = spans[a][0] if a < len(spans) else text_len
+    return start, (spans[b - 1][1] if b > a else start)
+
+
+def reclassify_window(plan, spans, text_len, context):
+    """Chunk window to re-run the classifier on, widened by `context` chunks and to whole old entities.
+    Returns (new_start, new_end, old_start, old_end, suffix_shift) in corrected-text offsets."""
+    old_spans, old_len = plan["old_spans"], len(plan["old_corrected"])
+    n_old, n_new, p, q = len(old_spans), len(spans), plan["p"], plan["q"]
+    context = max(1, context)
+    a = max(0, p - context)
+    tail = max(0, q - context)          # shared chunks left outside the window at the end
+    while True:
+        old_start, old_end = _char_range(old_spans, a, n_old - tail, old_len)
+        straddles_start = a > 0 and any(e["start"] < old_start < e["end"] for e in plan["old_entities"])
+        straddles_end = tail > 0 and any(e["start"] < old_end < e["end"] for e in plan["old_entities"])
+        if not (straddles_start or straddles_end): break
+        if straddles_start: a -= 1
+        if straddles_end: tail -= 1
+    new_start, new_end = _char_range(spans, a, n_new - tail, text_len)
+    suffix_shift = (spans[n_new - tail][0] - old_spans[n_old - tail][0]) if tail else 0
+    return new_start, new_end, old_start, old_end, suffix_shift
+
+
+def merge_entities(old_entities, window_entities, old_start, old_end, suffix_shift):
+    """Old entities outside the window (suffix ones shifted) plus the window's fresh entities, by offset."""
+    kept = []
+    for e in old_entities:
+        if e["end"] <= old_start and not (e["start"] == e["end"] == old_start):
+            kept.append(e)
+        elif e["start"] >= old_end and not (e["start"] == e["end"] == old_end):
+            kept.append({**e, "start": e["start"] + suffix_shift, "end": e["end"] + suffix_shift})
+    return sorted(kept + window_entities, key=lambda e: (e["start"], e["end"]))
@@ -0,0 +1,29 @@
+# metrics.py
+# Process-wide counters shared by the request threads, exposed through GET /metrics.
+import threading
+
+
+class Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+def ratio(hits, misses):
+    total = hits + misses
+    return round(hits / total, 4) if total else 0.0
+
+
+metrics = Counters()
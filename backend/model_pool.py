@@ -0,0 +1,87 @@
+# model_pool.py
+# Bounded pool of inference replicas handed out through a checkout queue.
+#   - Replicas of a Hugging Face pipeline share one set of weights; each is a separate pipeline object,
+#     so at most `replicas` forward passes run at once and callers beyond that wait in the queue.
+#   - Torch intra-op / inter-op thread counts are process-global (torch.set_num_threads), not per
+#     replica: every concurrent forward pass uses its own team of that many intra-op threads, so
+#     workers x replicas x intra-op threads is what has to fit the cores. There is no per-replica core
+#     pinning; the affinity of the calling Python thread does not reach Torch's existing worker threads.
+#     To pin, start each worker process under taskset / a cpuset before Torch is imported.
+import os
+import queue
+import time
+from contextlib import contextmanager
+
+from metrics import metrics
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def configure_torch_threads(intra_op=None, inter_op=None):
+    """Returns the (intra, inter) counts in effect; inter-op can only be changed before Torch's first parallel op."""
+    import torch
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            print(f"WARNING: Could not set inter-op threads to {inter_op} ({e}).")
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def replicate_pipeline(first, count, task, **kwargs):
+    """`first` plus count-1 more pipelines over the same model and tokenizer objects."""
+    from transformers import pipeline
+    return [first] + [pipeline(task, model=first.model, tokenizer=first.tokenizer, **kwargs) for _ in range(count - 1)]
+
+
+class ReplicaPool:
+    def __init__(self, name, replicas, on_wait=None):
+        self.name = name
+        self.on_wait = on_wait   # called with each checkout's wait in ms
+        self.size = len(replicas)
+        self._queue = queue.Queue()
+        for replica in replicas:
+            self._queue.put(replica)
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        started = time.perf_counter()
+        try:
+            replica = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No {self.name} replica free within {timeout}s") from None
+        metrics.incr(f"{self.name}_pool_checkouts")
+        wait_ms = (time.perf_counter() - started) * 1000
+        metrics.incr(f"{self.name}_pool_wait_ms", round(wait_ms))
+        if self.on_wait:
+            self.on_wait(wait_ms)
+        try:
+            yield replica
+        finally:
+            self._queue.put(replica)
+
+    def __call__(self, *args, **kwargs):
+        # Drop-in for a single pipeline object.
+        with self.checkout() as replica:
+            return replica(*args, **kwargs)
+
+    def in_use(self):
+        return self.size - self._queue.qsize()
+
+
+def load_pool(name, load_first, task, replicas=1, on_wait=None, **kwargs):
+    first = load_first()
+    pool = ReplicaPool(name, replicate_pipeline(first, replicas, task, **kwargs), on_wait=on_wait)
+    print(f"{name}: {replicas} replica(s).")
+    return pool
+
+
+def default_thread_counts(replicas, workers=1):
+    """Process-wide intra-op thread count so that workers x replicas x threads fits the available cores."""
+    return max(1, len(available_cores()) // max(1, replicas * workers))
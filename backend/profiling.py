@@ -0,0 +1,251 @@
+# profiling.py
+# Admin-triggered profiling of selected hot functions (tier1, tier2, validate_submission).
+# Nothing is wrapped until a session is armed: arming swaps the registered attributes for profiling
+# wrappers and ending the session puts the originals back, so there is no cost while idle.
+#   - "cprofile": each selected call runs under cProfile; the session is dumped as one .prof file.
+#   - "sample": a sampler thread records the stacks of threads inside selected calls every
+#     `interval_ms`; the session is dumped as collapsed stacks (flamegraph.pl / speedscope input).
+# A session selects the next `count` calls, or 1 in `sample_every` calls until `count` are taken.
+# HeapTracker wraps tracemalloc: start it, then diff snapshots against the starting baseline.
+import cProfile
+import inspect
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class ProfileSession:
+    def __init__(self, mode, count, sample_every, interval_ms):
+        self.mode = mode
+        self.count = count
+        self.sample_every = sample_every
+        self.interval_ms = interval_ms
+        self.started_at = datetime.utcnow()
+        self.lock = threading.Lock()
+        self.taken = self.finished = 0
+        self.closed = False
+        self.profiles = []          # cProfile.Profile per selected call ("cprofile")
+        self.active = {}            # thread ident -> label of the selected call it is inside ("sample")
+        self.stacks = Counter()     # collapsed stack -> samples ("sample")
+
+    def take(self):
+        with self.lock:
+            if self.closed or self.taken >= self.count: return False
+            if self.sample_every > 1 and random.randrange(self.sample_every): return False
+            self.taken += 1
+            return True
+
+    def finish(self):
+        with self.lock:
+            self.finished += 1
+            return self.finished >= self.count
+
+    def summary(self):
+        return {"mode": self.mode, "count": self.count, "sample_every": self.sample_every,
+                "interval_ms": self.interval_ms, "taken": self.taken, "finished": self.finished,
+                "started_at": self.started_at.isoformat()}
+
+
+class FunctionProfiler:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._targets = []          # (owner, attribute, label)
+        self._restore = []          # (owner, attribute, original or None to delete the shadowing attribute)
+        self._session = None
+        self.dumps = []
+
+    def register(self, owner, attribute, label=None):
+        self._targets.append((owner, attribute, label or attribute))
+
+    # --- Session control ----------------------------------------------------
+    def start(self, mode="cprofile", count=10, sample_every=1, interval_ms=5):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}")
+        if count < 1 or sample_every < 1 or interval_ms <= 0:
+            raise ValueError("count and sample_every must be >= 1 and interval_ms > 0")
+        with self._lock:
+            if self._session is not None:
+                raise ValueError("A profiling session is already running.")
+            session = self._session = ProfileSession(mode, count, sample_every, interval_ms)
+            for owner, attribute, label in self._targets:
+                original = getattr(owner, attribute)
+                # Methods live on the class; the wrapper shadows them on the instance and is deleted afterwards.
+                self._restore.append((owner, attribute, original if attribute in vars(owner) else None))
+                setattr(owner, attribute, self._wrap(session, original, label))
+        if mode == "sample":
+            threading.Thread(target=self._sample_loop, args=(session,), name="profile-sampler", daemon=True).start()
+        print(f"Profiling armed: {session.summary()}")
+        return session.summary()
+
+    def stop(self, session=None):
+        """End the running session (only if it is `session`, when given) and write its dump."""
+        with self._lock:
+            if self._session is None or (session is not None and session is not self._session):
+                return None
+            session, self._session = self._session, None
+            for owner, attribute, original in reversed(self._restore):
+                if original is None: delattr(owner, attribute)
+                else: setattr(owner, attribute, original)
+            self._restore = []
+            with session.lock:
+                session.closed = True
+        path = self._dump(session)
+        print(f"Profiling session finished: {session.summary()} -> {path}")
+        return path
+
+    def status(self):
+        with self._lock:
+            session = self._session
+        return {"running": session.summary() if session else None, "dumps": list(self.dumps)}
+
+    # --- Wrappers -----------------------------------------------------------
+    def _wrap(self, session, original, label):
+        if inspect.isgeneratorfunction(original) or inspect.isgeneratorfunction(getattr(original, "__func__", None)):
+            def generator_wrapper(*args, **kwargs):
+                if not session.take():
+                    return (yield from original(*args, **kwargs))
+                try:
+                    iterator = original(*args, **kwargs)
+                    while True:
+                        # Only time spent producing items is attributed, not the consumer's work in between.
+                        with self._measure(session, label):
+                            try:
+                                item = next(iterator)
+                            except StopIteration as stop:
+                                return stop.value
+                        yield item
+                finally:
+                    self._finish(session)
+            return generator_wrapper
+
+        def wrapper(*args, **kwargs):
+            if not session.take():
+                return original(*args, **kwargs)
+            try:
+                with self._measure(session, label):
+                    return original(*args, **kwargs)
+            finally:
+                self._finish(session)
+        return wrapper
+
+    def _finish(self, session):
+        if session.finish():
+            self.stop(session)
+
+    @contextmanager
+    def _measure(self, session, label):
+        if session.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                yield   # another profiler is already active in this thread
+                return
+            try:
+                yield
+            finally:
+                profile.disable()
+                with session.lock:
+                    session.profiles.append(profile)
+        else:
+            ident = threading.get_ident()
+            with session.lock:
+                outer = session.active.get(ident)
+                session.active[ident] = outer or label
+            try:
+                yield
+            finally:
+                with session.lock:
+                    if outer is None: session.active.pop(ident, None)
+
+    def _sample_loop(self, session):
+        interval = session.interval_ms / 1000
+        while not session.closed:
+            time.sleep(interval)
+            with session.lock:
+                active = list(session.active.items())
+            if not active: continue
+            frames = sys._current_frames()
+            for ident, label in active:
+                frame, stack = frames.get(ident), []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                if stack:
+                    with session.lock:
+                        session.stacks[";".join([label] + stack[::-1])] += 1
+
+    def _dump(self, session):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = session.started_at.strftime("%Y%m%dT%H%M%S")
+        with session.lock:
+            profiles, stacks = list(session.profiles), dict(session.stacks)
+        if session.mode == "cprofile":
+            if not profiles: return None
+            path = os.path.join(self.output_dir, f"{stamp}-cprofile.prof")
+            pstats.Stats(*profiles).dump_stats(path)
+        else:
+            if not stacks: return None
+            path = os.path.join(self.output_dir, f"{stamp}-sample.collapsed")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, samples in sorted(stacks.items()):
+                    f.write(f"{stack} {samples}\n")
+        self.dumps.append(path)
+        return path
+
+
+class HeapTracker:
+    def __init__(self, output_dir, frames=25):
+        self.output_dir = output_dir
+        self.frames = frames
+        self.baseline = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            self.baseline = tracemalloc.take_snapshot()
+        return self.status()
+
+    def growth(self, top=20):
+        """Allocation growth since start(), largest first; the snapshot is also written to disk."""
+        with self._lock:
+            if self.baseline is None:
+                raise ValueError("Heap tracking is not started.")
+            snapshot = tracemalloc.take_snapshot()
+            baseline = self.baseline
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-heap.snapshot")
+        snapshot.dump(path)
+        stats = snapshot.compare_to(baseline, "lineno")
+        return {
+            **self.status(),
+            "snapshot": path,
+            "top": [{"where": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                     "size_kb": round(stat.size / 1024, 1), "count_diff": stat.count_diff}
+                    for stat in stats[:top]],
+        }
+
+    def stop(self):
+        with self._lock:
+            self.baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+        return self.status()
+
+    def status(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {"tracing": tracing, "current_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1)}
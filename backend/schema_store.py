@@ -0,0 +1,120 @@
+# schema_store.py
+# Content-addressed schema table. A schema (the list of field dicts) is stored once under the
+# SHA-256 of its canonical JSON; submissions and saved forms only keep that hash.
+# Every worker process keeps its own copy of the table: writes merge with the file under a
+# cross-process lock, and a lookup miss reloads the file if another worker has changed it.
+import hashlib
+import json
+import os
+import threading
+
+from file_lock import FileLock
+
+
+def schema_hash(schema):
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SchemaStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._schemas = {}
+        self._loaded_stat = None
+        with self._lock:
+            self._reload()
+
+    def __len__(self):
+        return len(self._schemas)
+
+    def _reload(self):
+        """Merge in the table on disk if it changed since we last read it."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (st.st_ino, st.st_mtime_ns, st.st_size) == self._loaded_stat:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                on_disk = json.load(f)
+            except json.JSONDecodeError:
+                on_disk = {}
+        self._schemas = {**on_disk, **self._schemas}
+        self._loaded_stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self, digest):
+        schema = self._schemas.get(digest)
+        if schema is None and digest:
+            with self._lock:
+                self._reload()   # interned by another worker
+                schema = self._schemas.get(digest)
+        return schema
+
+    def intern(self, schema, flush=True):
+        """Hash of `schema`; the table file is only rewritten the first time a schema is seen."""
+        digest = schema_hash(schema)
+        with self._lock:
+            if digest not in self._schemas:
+                self._schemas[digest] = schema
+                if flush:
+                    self._flush()
+        return digest
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # Merge with what other workers wrote, so a rewrite never drops their hashes.
+        with self._file_lock:
+            self._reload()
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._schemas, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            st = os.stat(self.path)
+            self._loaded_stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    # --- Record shapes -------------------------------------------------------
+    # submission: {"timestamp", "values", "schema_hash"}
+    # saved form: {"created_at", "schema_hash", "form": {title/prompt/template...}}
+
+    def dehydrate_form(self, form_schema, flush=True):
+        """Split a /save_form payload into its field list (interned) and the remaining metadata."""
+        if isinstance(form_schema, dict):
+            form = {k: v for k, v in form_schema.items() if k != "fields"}
+            return self.intern(form_schema.get("fields", []), flush), form
+        return self.intern(form_schema, flush), {}
+
+    def hydrate_form(self, record):
+        """Saved-form record in the original {"created_at", "schema": {..., "fields"}} shape."""
+        if "schema" in record:
+            return record
+        fields = self.get(record.get("schema_hash")) or []
+        return {"created_at": record.get("created_at"), "schema": {**record.get("form", {}), "fields": fields}}
+
+    def hydrate_submission(self, record):
+        if "schema" in record:
+            return record
+        return {**record, "schema": self.get(record.get("schema_hash")) or []}
+
+    def migrate_records(self, records, kind):
+        """Replace inline schemas in legacy records; returns (records, number migrated). One table write at the end."""
+        migrated, out = 0, []
+        for record in records:
+            if not isinstance(record, dict) or "schema" not in record:
+                out.append(record)
+                continue
+            migrated += 1
+            if kind == "submission":
+                rest = {k: v for k, v in record.items() if k != "schema"}
+                out.append({**rest, "schema_hash": self.intern(record["schema"], flush=False)})
+            else:
+                digest, form = self.dehydrate_form(record["schema"], flush=False)
+                out.append({"created_at": record.get("created_at"), "schema_hash": digest, "form": form})
+        if migrated:
+            self.flush()
+        return out, migrated
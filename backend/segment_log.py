@@ -0,0 +1,303 @@
+# segment_log.py
+# Append-only JSON-lines log split into segments.
+#   - The active segment is a plain .jsonl file; appends are one write + flush.
+#   - A segment is sealed after `max_segment_bytes` or `max_segment_seconds` and handed to a
+#     background thread that compresses it (gzip, or zstd when `zstandard` is installed).
+#   - Sealed segments are compressed in independent blocks of `block_records` lines, and a small
+#     sidecar index maps each block's first timestamp to its byte offset. Readers skip whole
+#     segments by their time bounds and seek straight to the first relevant block.
+#   - With `tag_field` (e.g. the schema hash), each block's index entry also lists the tag values it
+#     holds, so read(tag=...) skips segments and blocks without that tag without decompressing them.
+#   - Several worker processes may share a directory: appends and sealing happen under a file
+#     lock, the active segment is whatever STATE_FILE names, each sealed segment is compacted
+#     by whichever process locks its raw file first, and a legacy JSON file is imported by whichever
+#     process locks the log first.
+# Timestamps are the ISO-8601 strings the app already writes, so they compare as strings.
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+from file_lock import FileLock, try_lock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx.json"
+CODEC_SUFFIX = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+STATE_FILE = "active.json"   # {"seq", "opened"} of the segment all workers append to
+LOCK_FILE = ".lock"
+
+
+def _compress(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(codec, data):
+    # Blocks are independent gzip members / zstd frames, so each one decodes on its own.
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class SegmentLog:
+    def __init__(self, directory, ts_field="timestamp", max_segment_bytes=16 * 2**20,
+                 max_segment_seconds=24 * 3600, block_records=256, codec="gzip", tag_field=None):
+        self.directory = directory
+        self.ts_field = ts_field
+        self.tag_field = tag_field
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.block_records = block_records
+        self.codec = "zstd" if codec == "zstd" and zstandard is not None else "gzip"
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = FileLock(os.path.join(directory, LOCK_FILE))
+        self._active, self._active_seq, self._state_key = None, None, None
+        self._compaction_queue = queue.Queue()
+        self._worker = threading.Thread(target=self._compaction_loop, name=f"compact-{os.path.basename(directory)}", daemon=True)
+        self._worker.start()
+        self._recover()
+
+    # --- Segment bookkeeping --------------------------------------------------
+    def _path(self, seq, suffix):
+        return os.path.join(self.directory, f"{seq:08d}{suffix}")
+
+    def _segments(self):
+        """Sorted {seq: kind} for every segment on disk; kind is 'raw' or 'compressed'."""
+        found = {}
+        for name in os.listdir(self.directory):
+            seq = name.split(".", 1)[0]
+            if not seq.isdigit(): continue
+            if name.endswith(INDEX_SUFFIX):
+                found[int(seq)] = "compressed"
+            elif name.endswith(RAW_SUFFIX):
+                found.setdefault(int(seq), "raw")
+        return dict(sorted(found.items()))
+
+    def _recover(self):
+        with self._lock:
+            self._sync_active()
+        # Raw segments before the active one were sealed (by any worker) and may still need compacting.
+        for seq, kind in self._segments().items():
+            if kind == "raw" and seq < self._active_seq:
+                self._compaction_queue.put(seq)
+
+    def _write_state(self, seq, opened):
+        state_path = os.path.join(self.directory, STATE_FILE)
+        with open(f"{state_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "opened": opened}, f)
+        os.replace(f"{state_path}.{os.getpid()}.tmp", state_path)
+
+    def _sync_active(self):
+        """Point self._active at the segment STATE_FILE names (lock held); cheap when it has not moved."""
+        state_path = os.path.join(self.directory, STATE_FILE)
+        try:
+            st = os.stat(state_path)
+        except FileNotFoundError:
+            # First start (or a directory from before STATE_FILE): the newest raw segment stays active.
+            segments = self._segments()
+            raw = [seq for seq, kind in segments.items() if kind == "raw"]
+            self._write_state(raw[-1] if raw and raw[-1] == max(segments) else max(segments, default=0) + 1, time.time())
+            st = os.stat(state_path)
+        if (st.st_ino, st.st_mtime_ns) == self._state_key:
+            return
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self._state_key = (st.st_ino, st.st_mtime_ns)
+        self._active_opened = state["opened"]
+        if state["seq"] != self._active_seq:
+            if self._active: self._active.close()
+            self._active_seq = state["seq"]
+            self._active = open(self._path(self._active_seq, RAW_SUFFIX), "ab")
+
+    def _seal_active(self):
+        self._compaction_queue.put(self._active_seq)
+        self._write_state(self._active_seq + 1, time.time())
+        self._sync_active()
+
+    # --- Writing ------------------------------------------------------------
+    def append(self, record):
+        with self._lock:
+            self._append_locked(record)
+
+    def _append_locked(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._sync_active()
+        size = os.fstat(self._active.fileno()).st_size   # includes other workers' appends
+        if size and (size + len(line) > self.max_segment_bytes
+                     or time.time() - self._active_opened > self.max_segment_seconds):
+            self._seal_active()
+        self._active.write(line)
+        self._active.flush()
+
+    def position(self):
+        """(active segment, its size): changes with every append by any worker, so it can key caches of read()."""
+        with self._lock:
+            self._sync_active()
+            return self._active_seq, os.fstat(self._active.fileno()).st_size
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def close(self):
+        with self._lock:
+            self._active.close()
+        self._compaction_queue.put(None)
+        self._worker.join()
+
+    # --- Background compaction ----------------------------------------------
+    def _compaction_loop(self):
+        while True:
+            seq = self._compaction_queue.get()
+            if seq is None: return
+            try:
+                self._compact(seq)
+            except Exception as e:
+                print(f"WARNING: Could not compact segment {seq} in {self.directory}: {e}")
+
+    def _compact(self, seq):
+        raw_path = self._path(seq, RAW_SUFFIX)
+        try:
+            src = open(raw_path, "rb")
+        except FileNotFoundError:
+            return
+        with src:
+            # Another worker compacting (or done with) the same segment wins; the raw file is locked meanwhile.
+            if not try_lock(src) or os.path.exists(self._path(seq, INDEX_SUFFIX)) or not os.path.exists(raw_path):
+                return
+            self._compact_locked(seq, src, raw_path)
+
+    def _compact_locked(self, seq, src, raw_path):
+        out_path = self._path(seq, CODEC_SUFFIX[self.codec])
+        tmp_suffix = f".{os.getpid()}.tmp"
+        blocks, records, first_ts, last_ts = [], 0, None, None
+        with open(out_path + tmp_suffix, "wb") as dst:
+            batch = []
+            for line in src:
+                if not line.strip(): continue
+                batch.append(line)
+                if len(batch) == self.block_records:
+                    first_ts, last_ts = self._write_block(dst, batch, blocks, first_ts, last_ts)
+                    records += len(batch); batch = []
+            if batch:
+                first_ts, last_ts = self._write_block(dst, batch, blocks, first_ts, last_ts)
+                records += len(batch)
+            end_offset = dst.tell()
+        os.replace(out_path + tmp_suffix, out_path)
+        index = {"codec": self.codec, "file": os.path.basename(out_path), "records": records,
+                 "first_ts": first_ts, "last_ts": last_ts, "blocks": blocks, "end": end_offset}
+        with open(self._path(seq, INDEX_SUFFIX) + tmp_suffix, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        # The index appearing is what makes readers switch over, so it goes last, then the raw file.
+        os.replace(self._path(seq, INDEX_SUFFIX) + tmp_suffix, self._path(seq, INDEX_SUFFIX))
+        os.remove(raw_path)
+
+    def _write_block(self, dst, batch, blocks, first_ts, last_ts):
+        block_first = json.loads(batch[0]).get(self.ts_field)
+        block_last = json.loads(batch[-1]).get(self.ts_field)
+        entry = [block_first, dst.tell()]
+        if self.tag_field:
+            # [first_ts, offset, tags]; indexes without the third item predate tagging and are always read.
+            entry.append(sorted({str(json.loads(line).get(self.tag_field)) for line in batch}))
+        blocks.append(entry)
+        dst.write(_compress(self.codec, b"".join(batch)))
+        return first_ts if first_ts is not None else block_first, block_last
+
+    # --- Reading ------------------------------------------------------------
+    def read(self, start=None, end=None, tag=None):
+        """Records with start <= ts < end, oldest first. Either bound may be None.
+        `tag` keeps only records whose tag_field equals it (needs tag_field)."""
+        with self._lock:
+            segments = self._segments()
+            self._active.flush()
+        for seq, kind in segments.items():
+            if kind == "raw":
+                try:
+                    f = open(self._path(seq, RAW_SUFFIX), "rb")
+                except FileNotFoundError:
+                    kind = "compressed"   # compacted since the directory was listed; the index came first
+                else:
+                    with f:
+                        yield from self._read_raw(f, start, end, tag)
+            if kind == "compressed":
+                yield from self._read_compressed(seq, start, end, tag)
+
+    def _in_range(self, ts, start, end):
+        return (start is None or (ts or "") >= start) and (end is None or (ts or "") < end)
+
+    def _matches(self, line, start, end, tag):
+        # The tag's text must appear in the line, which rules out most lines before parsing them.
+        if tag is not None and tag.encode("utf-8") not in line:
+            return None
+        record = json.loads(line)
+        if tag is not None and str(record.get(self.tag_field)) != tag:
+            return None
+        return record if self._in_range(record.get(self.ts_field), start, end) else None
+
+    def _read_raw(self, f, start, end, tag=None):
+        for line in f:
+            if not line.strip(): continue
+            try:
+                record = self._matches(line, start, end, tag)
+            except json.JSONDecodeError:
+                continue   # torn final line after a crash
+            if record is not None:
+                yield record
+
+    def _read_compressed(self, seq, start, end, tag=None):
+        with open(self._path(seq, INDEX_SUFFIX), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if not index["blocks"]: return
+        if start is not None and (index["last_ts"] or "") < start: return
+        if end is not None and (index["first_ts"] or "") >= end: return
+        if tag is not None and all(len(b) > 2 and tag not in b[2] for b in index["blocks"]): return
+
+        # Blocks from the last one starting <= start up to the first one starting >= end; the rest stay compressed.
+        blocks = index["blocks"]
+        first = 0
+        if start is not None:
+            for i, block in enumerate(blocks):
+                if (block[0] or "") > start: break
+                first = i
+        data_path = os.path.join(self.directory, index["file"])
+        with open(data_path, "rb") as raw:
+            file_end = index.get("end") or os.fstat(raw.fileno()).st_size
+            for i in range(first, len(blocks)):
+                block_ts, offset = blocks[i][:2]
+                if end is not None and i > first and (block_ts or "") >= end: return
+                if tag is not None and len(blocks[i]) > 2 and tag not in blocks[i][2]: continue
+                raw.seek(offset)
+                data = raw.read((blocks[i + 1][1] if i + 1 < len(blocks) else file_end) - offset)
+                for line in _decompress(index["codec"], data).splitlines():
+                    if not line.strip(): continue
+                    record = self._matches(line, start, end, tag)
+                    if record is not None:
+                        yield record
+
+    def import_legacy(self, legacy_path, read_json, convert=None):
+        """One-off move of a JSON-array file into the log; the old file is kept as *.migrated.
+        `convert(records)` may rewrite the records first. Every worker calls this at startup: the
+        first one to take the lock imports the file and the rest find it gone and return 0."""
+        with self._lock:
+            if not os.path.exists(legacy_path): return 0
+            records = read_json(legacy_path)
+            if convert and records:
+                records = convert(records)
+            # Renaming claims the file before anything is appended, so it can never be imported twice.
+            try:
+                os.replace(legacy_path, legacy_path + ".migrated")
+            except FileNotFoundError:
+                return 0   # another worker already imported it
+            records = sorted((r for r in records if isinstance(r, dict)), key=lambda r: r.get(self.ts_field) or "")
+            for record in records:
+                self._append_locked(record)
+        return len(records)
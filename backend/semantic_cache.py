@@ -0,0 +1,162 @@
+# semantic_cache.py
+# Reuse forms users already accepted (POST /save_form) for prompts that mean the same thing.
+# Prompt embeddings live in one preallocated matrix; a lookup is a single matrix-vector product
+# over the occupied rows. Rows are recycled least-recently-used first, and expire after max_age.
+# /save_form is open to anyone, so only fields that match the knowledge base (known id, its type,
+# well-typed rules) are cached; everything else in a saved form is dropped before it can be served.
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+MAX_LABEL_CHARS = 200
+# Validation keys a cached field may carry, and the JSON types their values must have.
+RULE_TYPES = {
+    "required": bool, "mustBeChecked": bool,
+    "min": (int, float), "max": (int, float), "minLength": int, "maxLength": int, "step": (int, float),
+    "maxSizeMB": (int, float), "maxTags": int, "minSelections": int,
+    "rule": str, "matches": str, "source": str,
+}
+
+
+class SemanticCache:
+    def __init__(self, encode, catalog, template_names=(), max_entries=2000, max_age_seconds=30 * 24 * 3600,
+                 threshold=0.92):
+        self.encode = encode
+        self.catalog = catalog              # field id -> knowledge-base definition
+        self.template_names = set(template_names)
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix = None                 # (max_entries, dim) float32, allocated on first insert
+        self._entries = {}                  # row -> {"prompt", "form", "created_at"}
+        self._created_at = np.full(max_entries, -np.inf)   # per row; free rows never match
+        self._lru = OrderedDict()           # row -> None, oldest use first
+        self._by_prompt = {}                # normalized prompt -> row
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(prompt):
+        return " ".join(prompt.lower().split())
+
+    def _evict(self, row):
+        entry = self._entries.pop(row)
+        self._lru.pop(row, None)
+        self._by_prompt.pop(self._key(entry["prompt"]), None)
+        self._matrix[row] = 0.0
+        self._created_at[row] = -np.inf
+        self._free_rows.append(row)
+
+    def _evict_expired(self, now):
+        for row in [r for r, e in self._entries.items() if now - e["created_at"] > self.max_age_seconds]:
+            self._evict(row)
+
+    def add(self, prompt, form, created_at=None, vector=None):
+        if not prompt or not prompt.strip():
+            return
+        if vector is None:
+            vector = self.encode([prompt])[0]
+        created_at = created_at or time.time()
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            key = self._key(prompt)
+            row = self._by_prompt.get(key)
+            if row is None:
+                self._evict_expired(time.time())
+                if not self._free_rows:
+                    self._evict(next(iter(self._lru)))
+                row = self._free_rows.pop()
+            self._matrix[row] = vector
+            self._created_at[row] = created_at
+            self._entries[row] = {"prompt": prompt, "form": form, "created_at": created_at}
+            self._by_prompt[key] = row
+            self._lru[row] = None
+            self._lru.move_to_end(row)
+
+    def lookup(self, prompt):
+        """(form, similarity, matched_prompt) for the closest saved prompt above the threshold, else None."""
+        with self._lock:
+            if not self._entries:
+                return None
+        vector = self.encode([prompt])[0]
+        with self._lock:
+            if not self._entries:
+                return None
+            # Expired and free rows are masked, so the best live match wins; they are evicted on insert.
+            live = time.time() - self._created_at <= self.max_age_seconds
+            scores = np.where(live, self._matrix @ vector, -np.inf)
+            row = int(np.argmax(scores))
+            score = float(scores[row])
+            entry = self._entries.get(row)
+            if entry is None or not live[row] or score < self.threshold:
+                return None
+            self._lru.move_to_end(row)
+            return entry["form"], score, entry["prompt"]
+
+    def warm(self, saved_forms):
+        """Load forms already in forms.json (oldest first, so the newest survive the size bound)."""
+        usable = []
+        for record in saved_forms:
+            schema = record.get("schema") if isinstance(record, dict) else None
+            if not isinstance(schema, dict) or not schema.get("prompt") or not schema.get("fields"):
+                continue
+            try:
+                saved_at = datetime.fromisoformat(record.get("created_at", ""))
+                # /save_form writes naive UTC timestamps.
+                created_at = (saved_at if saved_at.tzinfo else saved_at.replace(tzinfo=timezone.utc)).timestamp()
+            except ValueError:
+                created_at = time.time()
+            usable.append((created_at, schema))
+        usable.sort(key=lambda item: item[0])
+        usable = usable[-self.max_entries:]
+        if not usable:
+            return 0
+        vectors = self.encode([schema["prompt"] for _, schema in usable])
+        for (created_at, schema), vector in zip(usable, vectors):
+            if (form := cacheable_form(schema, self.catalog, self.template_names)):
+                self.add(schema["prompt"], form, created_at=created_at, vector=vector)
+        return len(self)
+
+
+def well_formed_field(field, catalog):
+    """A saved field that may be served to other users: a known id, its catalog type, sane label and rules."""
+    if not isinstance(field, dict) or not isinstance(field.get("id"), str) or field["id"] not in catalog:
+        return False
+    validation, options = field.get("validation") or {}, field.get("options") or []
+    if field.get("type") != catalog[field["id"]].get("type"):
+        return False
+    if not isinstance(field.get("label"), str) or not 0 < len(field["label"]) <= MAX_LABEL_CHARS:
+        return False
+    if not isinstance(validation, dict) or not isinstance(options, list):
+        return False
+    for key, value in validation.items():
+        if key == "fileTypes":
+            if not (isinstance(value, list) and all(isinstance(t, str) for t in value)): return False
+        elif key not in RULE_TYPES or not isinstance(value, RULE_TYPES[key]) or \
+                (isinstance(value, bool) and RULE_TYPES[key] is not bool):
+            return False
+    scalar = (str, int, float)
+    return all(isinstance(o, scalar) or (isinstance(o, dict) and all(isinstance(v, scalar) for v in o.values()))
+               for o in options)
+
+
+def cacheable_form(schema, catalog, template_names=()):
+    """The parts of a saved form that /process returns, keeping only well-formed known fields; None if none are."""
+    saved = schema.get("fields")
+    fields = [
+        {"id": f["id"], "label": f["label"], "type": f["type"],
+         "validation": f.get("validation") or {}, "options": f.get("options") or []}
+        for f in (saved if isinstance(saved, list) else []) if well_formed_field(f, catalog)
+    ]
+    if not fields:
+        return None
+    template = schema.get("template")
+    return {"title": "Generated Form", "template": template if isinstance(template, str) and template in template_names else "custom",
+            "fields": fields}
@@ -0,0 +1,105 @@
+# serialization.py
+# JSON encoding and response compression shared by every route.
+#   - FastJSONProvider makes `jsonify` use orjson when it is installed (stdlib json otherwise).
+#   - compress_response() gzip/brotli-encodes JSON bodies above a size threshold.
+#   - CatalogPayload serializes and compresses a static document once and answers conditional
+#     requests with 304 via a strong ETag.
+import gzip
+import hashlib
+import json
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass   # e.g. integers beyond 64 bits; the stdlib copes
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs:   # callers asking for indent/sort_keys get the stdlib behaviour they expect
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def preferred_encoding():
+    accepted = request.headers.get("Accept-Encoding", "").lower()
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _encode(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_response(response, min_bytes):
+    """after_request hook body: compress buffered JSON responses the client can decode."""
+    if (response.is_streamed or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype != "application/json"):
+        return response
+    data = response.get_data()
+    encoding = preferred_encoding() if len(data) >= min_bytes else None
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.set_data(_encode(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+class CatalogPayload:
+    """A JSON document serialized once, with precompressed variants and per-encoding strong ETags."""
+
+    def __init__(self, obj):
+        self.body = dumps(obj)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.variants = {None: (self.body, f'"{digest}"')}
+        self.variants["gzip"] = (_encode(self.body, "gzip"), f'"{digest}-gzip"')
+        if brotli is not None:
+            self.variants["br"] = (_encode(self.body, "br"), f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def respond(self):
+        encoding = preferred_encoding()
+        body, etag = self.variants.get(encoding, self.variants[None])
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "public, no-cache"}
+        if encoding in self.variants and encoding is not None:
+            headers["Content-Encoding"] = encoding   # also tells compress_response to leave it alone
+
+        # Every variant carries the same content, so any of our tags in If-None-Match means unchanged.
+        sent = {tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")}
+        if sent & self.etags or "*" in sent:
+            return Response(status=304, headers={"ETag": etag, "Vary": "Accept-Encoding",
+                                                 "Cache-Control": headers["Cache-Control"]})
+        return Response(body, mimetype="application/json", headers=headers)
@@ -0,0 +1,46 @@
+# speculation.py
+# Start a slow fallback (tier2) early when a confidence estimate says the fast path will probably miss,
+# and throw it away if the fast path succeeds after all.
+# The fallback receives a threading.Event it is expected to poll; setting it is how a running call is
+# cancelled (a call still waiting in the pool is simply never started).
+import threading
+import time
+
+from metrics import metrics
+
+
+class Speculation:
+    def __init__(self, executor, fn, threshold):
+        self.executor = executor
+        self.fn = fn
+        self.threshold = threshold
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.started_at = None
+
+    @property
+    def started(self):
+        return self.future is not None
+
+    def consider(self, confidence):
+        """Start the fallback below the threshold; a later, confident estimate calls it off again."""
+        if confidence < self.threshold and not self.started and not self.cancel_event.is_set():
+            print(f"DEBUG: Speculating on tier2 (tier1 confidence {confidence:.2f} < {self.threshold}).")
+            metrics.incr("speculation_started")
+            self.started_at = time.perf_counter()
+            self.future = self.executor.submit(self.fn, self.cancel_event)
+        elif confidence >= self.threshold and self.started:
+            self.cancel()
+
+    def cancel(self):
+        if not self.started or self.cancel_event.is_set(): return
+        self.cancel_event.set()
+        self.future.cancel()
+        metrics.incr("speculation_wasted")
+        metrics.incr("speculation_wasted_ms", round((time.perf_counter() - self.started_at) * 1000))
+
+    def result(self):
+        """The fallback's answer; the time it already ran in the background is latency saved."""
+        metrics.incr("speculation_useful")
+        metrics.incr("speculation_saved_ms", round((time.perf_counter() - self.started_at) * 1000))
+        return self.future.result()
@@ -0,0 +1,130 @@
+# submission_stats.py
+# Per-form aggregates for GET /forms/<id>/stats, computed from the logs every worker shares.
+# Accepted submissions are in the submissions log; rejected ones go to a rejections log holding only
+# the failing field IDs. Both are tagged by schema hash, so one form's aggregates read only its own
+# blocks, and the result is cached until either log's position() moves.
+# Schemas come from clients, so the per-form state is bounded: wide rating ranges share histogram
+# buckets, and only a limited number of distinct choice values are counted.
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+MAX_RATING_BUCKETS = 100
+MAX_OPTION_VALUES = 200
+OTHER_OPTION = "(other)"
+
+
+def _new_form(schema):
+    form = {"submissions": 0, "rejected": 0, "first_at": None, "last_at": None,
+            "ratings": {}, "options": {}, "field_errors": {}}
+    for field in schema:
+        fid, rules = field.get("id"), field.get("validation") or {}
+        if field.get("type") == "rating":
+            try:
+                mn, mx = int(rules.get("min", 1)), int(rules.get("max", 7))   # same defaults as validate_submission
+            except (TypeError, ValueError, OverflowError):
+                continue
+            if mx < mn: continue
+            width = math.ceil((mx - mn + 1) / MAX_RATING_BUCKETS)
+            buckets = math.ceil((mx - mn + 1) / width)
+            form["ratings"][fid] = {"min": mn, "max": mx, "width": width, "histogram": [0] * buckets,
+                                    "count": 0, "sum": 0}
+        elif field.get("type") in ("select", "radio"):
+            options = rules.get("options") or field.get("options") or []
+            form["options"][fid] = {option: 0 for option in options[:MAX_OPTION_VALUES] if isinstance(option, (str, int, float))} \
+                if isinstance(options, list) else {}
+    return form
+
+
+def _add_success(form, values, timestamp):
+    if not isinstance(values, dict): return
+    form["submissions"] += 1
+    form["first_at"] = form["first_at"] or timestamp
+    form["last_at"] = timestamp
+    for fid, rating in form["ratings"].items():
+        try:
+            value = int(values.get(fid, ""))
+        except (TypeError, ValueError):
+            continue
+        if rating["min"] <= value <= rating["max"]:
+            rating["histogram"][(value - rating["min"]) // rating["width"]] += 1
+            rating["count"] += 1
+            rating["sum"] += value
+    for fid, counts in form["options"].items():
+        value = values.get(fid)
+        if value in (None, "") or not isinstance(value, (str, int, float)): continue
+        if value not in counts and len(counts) >= MAX_OPTION_VALUES:
+            value = OTHER_OPTION
+        counts[value] = counts.get(value, 0) + 1
+
+
+def _add_failure(form, field_ids):
+    form["rejected"] += 1
+    for fid in field_ids if isinstance(field_ids, list) else ():
+        if isinstance(fid, str):
+            form["field_errors"][fid] = form["field_errors"].get(fid, 0) + 1
+
+
+def _summary(form):
+    attempts = form["submissions"] + form["rejected"]
+    return {
+        "submissions": form["submissions"],
+        "rejected": form["rejected"],
+        "error_rate": round(form["rejected"] / attempts, 4) if attempts else 0.0,
+        "first_at": form["first_at"],
+        "last_at": form["last_at"],
+        "ratings": {
+            fid: {"min": r["min"], "max": r["max"], "count": r["count"],
+                  "average": round(r["sum"] / r["count"], 3) if r["count"] else None,
+                  "histogram": {_bucket_label(r, i): n for i, n in enumerate(r["histogram"])}}
+            for fid, r in form["ratings"].items()
+        },
+        "options": {fid: dict(counts) for fid, counts in form["options"].items()},
+        "field_errors": dict(form["field_errors"]),
+    }
+
+
+class SubmissionStats:
+    """`submissions_log` / `rejections_log` are SegmentLogs with tag_field="schema_hash"."""
+
+    def __init__(self, submissions_log, rejections_log, max_cached_forms=256):
+        self.submissions_log = submissions_log
+        self.rejections_log = rejections_log
+        self.max_cached_forms = max_cached_forms
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # digest -> (log positions, summary)
+
+    def record_failure(self, digest, errors):
+        self.rejections_log.append({"timestamp": datetime.utcnow().isoformat(), "schema_hash": digest,
+                                    "fields": sorted(errors)})
+
+    def get(self, digest, schema):
+        """Aggregates for one stored form (zeroed when it has no submissions yet); None for an unknown one."""
+        if schema is None:
+            return None
+        positions = (self.submissions_log.position(), self.rejections_log.position())
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None and cached[0] == positions:
+                self._cache.move_to_end(digest)
+                return cached[1]
+
+        form = _new_form(schema)
+        for record in self.submissions_log.read(tag=digest):
+            _add_success(form, record.get("values"), record.get("timestamp"))
+        for record in self.rejections_log.read(tag=digest):
+            _add_failure(form, record.get("fields"))
+        summary = _summary(form)
+        with self._lock:
+            self._cache[digest] = (positions, summary)
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.max_cached_forms:
+                self._cache.popitem(last=False)
+        return summary
+
+
+def _bucket_label(rating, i):
+    low = rating["min"] + i * rating["width"]
+    high = min(low + rating["width"] - 1, rating["max"])
+    return str(low) if low == high else f"{low}-{high}"
@@ -0,0 +1,5 @@
+# The backend modules are flat scripts, so tests import them from the parent directory.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+# Randomized equivalence of entity_linking.link_entities with the linear-scan linker it replaced.
+import copy
+import random
+from types import SimpleNamespace
+
+from entity_linking import link_entities
+
+FIELD_WORDS = {"email": "EMAIL", "e-mail": "EMAIL", "phone": "PHONE", "name": "FULL_NAME",
+               "address": "ADDRESS", "password": "PASSWORD", "blob": None}
+QUANTITY_WORDS = ["one", "two", "three", "five", "2", "4", "some"]
+ATTRIBUTE_WORDS = ["optional", "required", "not needed", "don't", "mandatory"]
+PROMPT_WORDS = ["first", "second", "third", "latter", "former", "the", "form", "with", "and"]
+
+
+def make_field_map():
+    return {fid: SimpleNamespace(id=fid, label=fid.title(), type="text", validation={}, options=[])
+            for fid in set(FIELD_WORDS.values()) if fid}
+
+
+def legacy_link(prompt, entities, final_fields_map, field_map, resolve_field):
+    """app.py before the bisect rewrite, verbatim apart from the function wrapper."""
+    field_entities = sorted([e for e in entities if e.get('entity_group') == 'FIELD_NAME'], key=lambda x: x['start'])
+    ordered_field_ids = []
+    for field_entity in field_entities:
+        field_id = resolve_field(field_entity['word'])
+        if field_id:
+            if field_id not in final_fields_map:
+                final_fields_map[field_id] = copy.deepcopy(field_map[field_id])
+            if field_id not in ordered_field_ids:
+                ordered_field_ids.append(field_id)
+
+
+    # --- STEP 3: HANDLE DELETIONS (Directional Logic) ---
+    fields_to_remove = set()
+    negation_entities = [e for e in entities if e.get('entity_group') == 'NEGATION']
+    for neg_entity in negation_entities:
+        potential_targets = [fe for fe in field_entities if fe['start'] > neg_entity['end']]
+        if not potential_targets: continue
+        closest_field_entity = min(potential_targets, key=lambda fe: fe['start'] - neg_entity['end'])
+        field_id_to_remove = resolve_field(closest_field_entity['word'])
+        if field_id_to_remove: fields_to_remove.add(field_id_to_remove)
+
+    for field_id in fields_to_remove:
+        final_fields_map.pop(field_id, None)
+        if field_id in ordered_field_ids: ordered_field_ids.remove(field_id)
+
+    # --- STEP 4: HANDLE QUANTITIES ---
+    num_map = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+    quantified_fields_info = {}
+
+    for field_entity in field_entities:
+        field_id_base = resolve_field(field_entity['word'])
+        if not field_id_base or field_id_base not in final_fields_map: continue
+
+        relevant_quants = [e for e in entities if e.get('entity_group') == 'QUANTITY' and
+                        e['end'] < field_entity['start'] and (field_entity['start'] - e['end'] < 20)]
+        if relevant_quants:
+            quant_entity = min(relevant_quants, key=lambda x: field_entity['start'] - x['end'])
+            num_word = quant_entity['word'].lower()
+            num = int(num_word) if num_word.isdigit() else num_map.get(num_word, 1)
+
+            if num > 1:
+                original_field = final_fields_map.pop(field_id_base)
+                if field_id_base in ordered_field_ids: ordered_field_ids.remove(field_id_base)
+
+                quantified_fields_info[field_id_base] = []
+                for i in range(num):
+                    field_id = f"{field_id_base}_{i+1}"
+                    field_def = copy.deepcopy(original_field)
+                    field_def.id, field_def.label = field_id, f"{original_field.label} {i+1}"
+                    final_fields_map[field_id] = field_def
+                    quantified_fields_info[field_id_base].append(field_id)
+
+    # --- STEP 5: GENERALIZED ATTRIBUTE ASSIGNMENT (THE FINAL FIX) ---
+    attribute_entities = [e for e in entities if e.get('entity_group') == 'ATTRIBUTE']
+    ordinal_map = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "former": 1, "latter": -1}
+
+    for attr_entity in attribute_entities:
+        is_optional = "optional" in attr_entity['word'].lower() or "not" in attr_entity['word'].lower() or "don't" in attr_entity['word'].lower()
+        target_id = None
+
+        # Priority 1: Check for explicit ordinals/positionals
+        search_window = prompt[max(0, attr_entity['start'] - 25): attr_entity['end'] + 25].lower()
+        ordinal_found = None
+        for word, index in ordinal_map.items():
+            if word in search_window:
+                ordinal_found = index
+                break
+
+        # Link positional to the ordered list of mentioned fields
+        if ordinal_found and ordered_field_ids:
+            if ordinal_found == -1: # Handle "latter"
+                target_id = ordered_field_ids[-1]
+            elif ordinal_found > 0 and ordinal_found <= len(ordered_field_ids):
+                target_id = ordered_field_ids[ordinal_found - 1]
+
+        # Priority 2: Fallback to proximity-based linking
+        if not target_id:
+            if not field_entities: continue
+            closest_field_entity = min(field_entities, key=lambda fe: abs(fe['start'] - attr_entity['start']))
+            target_id = resolve_field(closest_field_entity['word'])
+
+        # Apply the modification
+        if target_id and target_id in final_fields_map:
+            final_fields_map[target_id].validation['required'] = not is_optional
+        elif target_id in quantified_fields_info: # Apply to all quantified fields if base is targeted
+            for q_id in quantified_fields_info[target_id]:
+                if q_id in final_fields_map:
+                    final_fields_map[q_id].validation['required'] = not is_optional
+    return ordered_field_ids
+
+
+def random_case(rng):
+    prompt = " ".join(rng.choice(PROMPT_WORDS) for _ in range(rng.randint(0, 30)))
+    entities = []
+    for _ in range(rng.randint(0, 12)):
+        group = rng.choice(["FIELD_NAME", "FIELD_NAME", "NEGATION", "QUANTITY", "ATTRIBUTE", "FORM_TYPE"])
+        start = rng.randint(0, 60)   # a narrow range, so equal starts and ends are common
+        end = start + rng.randint(0, 6)
+        word = {"FIELD_NAME": lambda: rng.choice(list(FIELD_WORDS)), "QUANTITY": lambda: rng.choice(QUANTITY_WORDS),
+                "ATTRIBUTE": lambda: rng.choice(ATTRIBUTE_WORDS)}.get(group, lambda: "no")()
+        entities.append({"entity_group": group, "word": word, "start": start, "end": end, "score": 0.9})
+    return prompt, entities
+
+
+def snapshot(ordered, fields):
+    return ordered, [(key, f.id, f.label, dict(f.validation)) for key, f in fields.items()]
+
+
+def run(linker, prompt, entities, field_map, initial):
+    fields = copy.deepcopy(initial)
+    ordered = linker(prompt, copy.deepcopy(entities), fields, field_map, FIELD_WORDS.get)
+    return snapshot(ordered, fields)
+
+
+def test_matches_legacy_linker_on_random_entities():
+    rng = random.Random(31)
+    field_map = make_field_map()
+    for _ in range(20000):
+        prompt, entities = random_case(rng)
+        # Sometimes a template has already contributed fields.
+        initial = {fid: copy.deepcopy(field_map[fid]) for fid in rng.sample(sorted(field_map), rng.randint(0, 2))}
+        assert run(link_entities, prompt, entities, field_map, initial) == \
+            run(legacy_link, prompt, entities, field_map, initial), (prompt, entities)
+
+
+def test_quantity_tie_goes_to_the_entity_the_model_returned_first():
+    field_map = make_field_map()
+    entities = [{"entity_group": "QUANTITY", "word": "three", "start": 4, "end": 9},
+                {"entity_group": "QUANTITY", "word": "two", "start": 0, "end": 9},
+                {"entity_group": "FIELD_NAME", "word": "phone", "start": 10, "end": 15}]
+    fields = {}
+    link_entities("", entities, fields, field_map, FIELD_WORDS.get)
+    assert list(fields) == ["PHONE_1", "PHONE_2", "PHONE_3"]
+
+
+def test_later_attribute_on_the_same_field_wins():
+    field_map = make_field_map()
+    entities = [{"entity_group": "FIELD_NAME", "word": "email", "start": 10, "end": 15},
+                {"entity_group": "ATTRIBUTE", "word": "required", "start": 20, "end": 28},
+                {"entity_group": "ATTRIBUTE", "word": "optional", "start": 0, "end": 8}]
+    fields = {}
+    link_entities("", entities, fields, field_map, FIELD_WORDS.get)
+    assert fields["EMAIL"].validation["required"] is False
@@ -0,0 +1,62 @@
+# plan_edit on `previous` sessions sent back by clients: malformed entities discard the whole session.
+import copy
+
+import pytest
+
+from incremental import plan_edit
+
+LABELS = {"FORM_TYPE", "FIELD_NAME", "NEGATION", "QUANTITY", "ATTRIBUTE"}
+PREVIOUS = {
+    "prompt": "registration form with email and phone",
+    "corrected": "registration form with email and phone",
+    "entities": [
+        {"entity_group": "FORM_TYPE", "word": "registration", "start": 0, "end": 12, "score": 0.98765},
+        {"entity_group": "FIELD_NAME", "word": "email", "start": 23, "end": 28, "score": 0.9, "field_id": "EMAIL"},
+        {"entity_group": "FIELD_NAME", "word": "phone", "start": 33, "end": 38, "score": 1, "field_id": None},
+    ],
+    "template": "registration",
+    "template_entity": [0, 12],
+}
+EDITED = "registration form with email and phone number"
+
+
+def with_entity(**changes):
+    previous = copy.deepcopy(PREVIOUS)
+    previous["entities"][1].update(changes)
+    return previous
+
+
+def test_valid_session_is_normalised():
+    plan = plan_edit(copy.deepcopy(PREVIOUS), EDITED, LABELS)
+    assert plan is not None
+    assert plan["old_entities"][0] == {"entity_group": "FORM_TYPE", "word": "registration", "start": 0, "end": 12,
+                                       "score": 0.9877}
+    assert plan["old_entities"][1]["field_id"] == "EMAIL" and plan["old_entities"][2]["field_id"] is None
+    assert all(isinstance(e["score"], float) for e in plan["old_entities"])
+
+
+@pytest.mark.parametrize("changes", [
+    {"field_id": []},
+    {"field_id": 7},
+    {"field_id": {"id": "EMAIL"}},
+    {"score": "x"},
+    {"score": float("nan")},
+    {"score": float("inf")},
+    {"score": None},
+    {"score": True},
+    {"entity_group": "NOT_A_LABEL"},
+    {"entity_group": ["FIELD_NAME"]},
+    {"entity_group": None},
+    {"word": 5},
+    {"start": "23"},
+    {"end": 1000},
+    {"start": 30, "end": 28},
+])
+def test_malformed_entity_discards_the_session(changes):
+    assert plan_edit(with_entity(**changes), EDITED, LABELS) is None
+
+
+def test_non_object_entity_discards_the_session():
+    previous = copy.deepcopy(PREVIOUS)
+    previous["entities"].append("FIELD_NAME")
+    assert plan_edit(previous, EDITED, LABELS) is None
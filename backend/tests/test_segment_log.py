@@ -0,0 +1,75 @@
+# SegmentLog shared between worker processes: the one-time legacy import and reads racing compaction.
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import file_lock
+import segment_log
+from segment_log import SegmentLog
+
+LEGACY_RECORDS = 20000
+WORKERS = 3
+
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def import_worker(directory, legacy_path, start, results):
+    start.wait()
+    log = SegmentLog(directory, max_segment_bytes=256 * 1024)
+    try:
+        results.put(log.import_legacy(legacy_path, read_json))
+    except Exception as e:
+        results.put(repr(e))
+    finally:
+        log.close()
+
+
+@pytest.mark.skipif(not file_lock.LOCKING, reason="needs fcntl locks")
+def test_legacy_file_is_imported_once_by_concurrent_workers(tmp_path):
+    directory, legacy_path = str(tmp_path / "log"), str(tmp_path / "submissions.json")
+    with open(legacy_path, "w", encoding="utf-8") as f:
+        json.dump([{"timestamp": f"2024-01-01T00:00:{i // 1000:02d}.{i:06d}", "n": i} for i in range(LEGACY_RECORDS)], f)
+
+    ctx = multiprocessing.get_context("fork")
+    start, results = ctx.Event(), ctx.Queue()
+    workers = [ctx.Process(target=import_worker, args=(directory, legacy_path, start, results)) for _ in range(WORKERS)]
+    for w in workers: w.start()
+    start.set()
+    outcomes = sorted((results.get(timeout=60) for _ in workers), key=str)
+    for w in workers: w.join(timeout=60)
+
+    assert outcomes == [0] * (WORKERS - 1) + [LEGACY_RECORDS]
+    assert all(w.exitcode == 0 for w in workers)
+    assert not os.path.exists(legacy_path) and os.path.exists(legacy_path + ".migrated")
+    log = SegmentLog(directory)
+    numbers = [record["n"] for record in log.read()]
+    log.close()
+    assert sorted(numbers) == list(range(LEGACY_RECORDS))
+
+
+def test_read_survives_compaction_between_listing_and_open(tmp_path, monkeypatch):
+    log = SegmentLog(str(tmp_path), max_segment_bytes=2048, block_records=8)
+    compact = log._compact
+    log._compact = lambda seq: None   # keep sealed segments raw until read() gets to them
+    for i in range(300):
+        log.append({"timestamp": f"2024-01-01T00:00:{i:06d}", "n": i})
+    sealed = [seq for seq, kind in log._segments().items() if kind == "raw" and seq < log._active_seq]
+    assert sealed
+
+    # Each sealed segment is compacted just as read() opens its raw file.
+    pending = {log._path(seq, ".jsonl"): seq for seq in sealed}
+    def racing_open(path, *args, **kwargs):
+        seq = pending.pop(path, None)
+        if seq is not None:
+            compact(seq)
+        return open(path, *args, **kwargs)
+    monkeypatch.setattr(segment_log, "open", racing_open, raising=False)
+
+    assert [record["n"] for record in log.read()] == list(range(300))
+    assert not pending
+    log.close()
@@ -0,0 +1,53 @@
+# Two workers, each with its own SegmentLogs and SubmissionStats over the same directories.
+import pytest
+
+from segment_log import SegmentLog
+from submission_stats import SubmissionStats
+
+SCHEMA = [{"id": "RATING", "type": "rating", "validation": {"min": 1, "max": 5}},
+          {"id": "COLOR", "type": "select", "options": ["red", "blue"]},
+          {"id": "EMAIL", "type": "text"}]
+
+
+@pytest.fixture
+def workers(tmp_path):
+    opened = []
+    for _ in range(2):
+        submissions = SegmentLog(str(tmp_path / "submissions"), tag_field="schema_hash")
+        rejections = SegmentLog(str(tmp_path / "rejections"), tag_field="schema_hash")
+        opened.append((submissions, SubmissionStats(submissions, rejections)))
+    yield opened
+    for submissions, stats in opened:
+        submissions.close()
+        stats.rejections_log.close()
+
+
+def submit(log, digest, values, timestamp):
+    log.append({"timestamp": timestamp, "values": values, "schema_hash": digest})
+
+
+def test_workers_report_the_same_totals(workers):
+    (log_a, stats_a), (log_b, stats_b) = workers
+    assert stats_a.get("f1", SCHEMA)["submissions"] == 0   # cached while empty
+
+    submit(log_a, "f1", {"RATING": "5", "COLOR": "red"}, "2024-01-01T00:00:00")
+    submit(log_b, "f1", {"RATING": "3", "COLOR": "blue"}, "2024-01-01T00:00:01")
+    submit(log_b, "other", {"RATING": "1"}, "2024-01-01T00:00:02")
+    stats_a.record_failure("f1", {"EMAIL": "Must be a valid email address."})
+    stats_b.record_failure("f1", {"EMAIL": "Must be a valid email address.", "RATING": "Rating must be a number."})
+
+    a, b = stats_a.get("f1", SCHEMA), stats_b.get("f1", SCHEMA)
+    assert a == b
+    assert a["submissions"] == 2 and a["rejected"] == 2 and a["error_rate"] == 0.5
+    assert a["ratings"]["RATING"]["histogram"] == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+    assert a["options"]["COLOR"] == {"red": 1, "blue": 1}
+    assert a["field_errors"] == {"EMAIL": 2, "RATING": 1}
+    assert (a["first_at"], a["last_at"]) == ("2024-01-01T00:00:00", "2024-01-01T00:00:01")
+
+    # A cached result is replaced as soon as another worker appends.
+    submit(log_b, "f1", {"RATING": "4"}, "2024-01-01T00:00:03")
+    assert stats_a.get("f1", SCHEMA)["submissions"] == 3
+
+
+def test_unknown_form_has_no_stats(workers):
+    assert workers[0][1].get("missing", None) is None
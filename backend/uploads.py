@@ -0,0 +1,192 @@
+# uploads.py
+# Streaming file uploads for `file` fields.
+#   - read_multipart() feeds the raw request body through Werkzeug's incremental multipart decoder,
+#     so file parts are never buffered whole: each chunk goes straight to a temp file on disk.
+#   - UploadWriter hashes and counts bytes as they arrive and enforces the field's `fileTypes`
+#     (extension and, for known types, leading magic bytes) and `maxSizeMB` mid-stream; a violation
+#     raises UploadRejected, the temp file is deleted and the rest of the body is not read.
+#   - Finished files stay staged in uploads/tmp until the submission they came with passes
+#     validation; then they are stored once under their SHA-256 (uploads/ab/abcdef...), otherwise
+#     deleted. Submissions keep only the returned reference.
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+CHUNK_BYTES = 64 * 1024
+STALE_TMP_SECONDS = 3600   # staged files left behind by a crashed worker are removed on startup
+MAX_FIELD_BYTES = 1024 * 1024   # non-file parts (the JSON payload) are held in memory
+
+# Leading bytes for the types fields.json restricts uploads to; other extensions are checked by name only.
+SIGNATURES = {
+    "pdf": [b"%PDF"],
+    "png": [b"\x89PNG\r\n\x1a\n"],
+    "jpg": [b"\xff\xd8\xff"],
+    "jpeg": [b"\xff\xd8\xff"],
+    "gif": [b"GIF87a", b"GIF89a"],
+    "docx": [b"PK\x03\x04"],
+    "avi": [b"RIFF"],
+}
+FTYP_TYPES = {"mp4", "mov"}   # ISO media files carry "ftyp" at offset 4
+SIGNATURE_BYTES = 12
+
+
+class UploadRejected(Exception):
+    def __init__(self, field_id, message, status=400):
+        super().__init__(message)
+        self.field_id = field_id
+        self.status = status
+
+
+def _signature_ok(ext, head):
+    if ext in FTYP_TYPES:
+        return head[4:8] == b"ftyp"
+    if ext == "avi":
+        return head[:4] == b"RIFF" and head[8:12] == b"AVI "
+    return any(head.startswith(sig) for sig in SIGNATURES[ext])
+
+
+class UploadWriter:
+    def __init__(self, store, field_id, filename, content_type, rules, default_max_mb):
+        self.store = store
+        self.field_id = field_id
+        self.filename = os.path.basename(filename or "")
+        self.content_type = content_type or "application/octet-stream"
+        self.ext = os.path.splitext(self.filename)[1].lstrip(".").lower()
+        allowed = [str(t).lower().lstrip(".") for t in rules.get("fileTypes") or []]
+        if allowed and self.ext not in allowed:
+            raise UploadRejected(field_id, f"File type must be one of: {', '.join(allowed)}.", 415)
+        self.check_signature = bool(allowed) and (self.ext in SIGNATURES or self.ext in FTYP_TYPES)
+        self.max_mb = rules.get("maxSizeMB") or default_max_mb
+        self.max_bytes = float(self.max_mb) * 1024 * 1024
+        self.size = 0
+        self.digest = None
+        self._head = b""
+        self._hash = hashlib.sha256()
+        self._tmp = tempfile.NamedTemporaryFile(dir=store.tmp_dir, delete=False)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(self.field_id, f"File must be no larger than {self.max_mb} MB.", 413)
+        if self.check_signature and len(self._head) < SIGNATURE_BYTES:
+            self._head += data[:SIGNATURE_BYTES - len(self._head)]
+            if len(self._head) == SIGNATURE_BYTES:
+                self._verify_signature()
+        self._hash.update(data)
+        self._tmp.write(data)
+
+    def _verify_signature(self):
+        self.check_signature = False
+        if not _signature_ok(self.ext, self._head):
+            raise UploadRejected(self.field_id, f"File content does not match its .{self.ext} extension.", 415)
+
+    def finish(self):
+        if self.check_signature:
+            self._verify_signature()   # files shorter than the signature window
+        self._tmp.close()
+        self.digest = self._hash.hexdigest()
+        return {"sha256": self.digest, "size": self.size, "filename": self.filename, "content_type": self.content_type}
+
+    def commit(self):
+        self.store.commit(self._tmp.name, self.digest)
+
+    def abort(self):
+        self._tmp.close()
+        try:
+            os.remove(self._tmp.name)
+        except OSError:
+            pass
+
+
+class UploadStore:
+    def __init__(self, directory, default_max_mb=25):
+        self.directory = directory
+        self.default_max_mb = default_max_mb
+        self.tmp_dir = os.path.join(directory, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.purge_stale()
+
+    def purge_stale(self, max_age=STALE_TMP_SECONDS):
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def exists(self, digest):
+        return bool(re.fullmatch(r"[0-9a-f]{64}", digest or "")) and os.path.exists(self.path(digest))
+
+    def commit(self, tmp_path, digest):
+        target = self.path(digest)
+        if os.path.exists(target):
+            os.remove(tmp_path)   # same content already stored
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+    def writer(self, field_id, filename, content_type, rules):
+        return UploadWriter(self, field_id, filename, content_type, rules, self.default_max_mb)
+
+    def commit_staged(self, writers):
+        for writer in writers:
+            writer.commit()
+
+    def discard_staged(self, writers):
+        for writer in writers:
+            writer.abort()
+
+
+def read_multipart(stream, boundary, on_field, open_file):
+    """Stream a multipart body. on_field(name, text) gets each non-file part as it completes;
+    open_file(name, filename, headers) returns an UploadWriter for each file part.
+    Returns ({field name: reference, or a list for fields sent more than once}, staged writers);
+    the caller commits or discards the staged files. On any error nothing stays on disk."""
+    decoder = MultipartDecoder(boundary.encode("latin-1"), max_form_memory_size=MAX_FIELD_BYTES)
+    files, part, writer, staged, complete = {}, None, None, [], False
+    try:
+        while True:
+            chunk = stream.read(CHUNK_BYTES)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    writer = open_file(event.name, event.filename, event.headers)
+                elif isinstance(event, Field):
+                    part = (event.name, [])
+                elif isinstance(event, Data):
+                    if writer is not None:
+                        writer.write(event.data)
+                        if not event.more_data:
+                            staged.append(writer)
+                            reference, name, writer = writer.finish(), writer.field_id, None
+                            if name in files:
+                                files[name] = (files[name] if isinstance(files[name], list) else [files[name]]) + [reference]
+                            else:
+                                files[name] = reference
+                    elif part is not None:
+                        part[1].append(event.data)
+                        if not event.more_data:
+                            on_field(part[0], b"".join(part[1]).decode("utf-8"))
+                            part = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                complete = True
+                return files, staged
+            if not chunk:
+                raise ValueError("The upload ended before the multipart body was complete.")
+    finally:
+        if writer is not None:
+            writer.abort()
+        if not complete:
+            for done in staged:
+                done.abort()
@@ -0,0 +1,160 @@
+# username_service.py
+# Username availability for the `available_username` validation rule.
+#   - UsernameChecker talks to a user service (GET /users/<name>/available -> {"available": bool})
+#     through one pooled httpx.AsyncClient running on a private event loop thread. Lookups are
+#     bounded by a semaphore, identical in-flight lookups share one request, and answers are cached
+#     (taken names for longer than free ones) in a bounded LRU table. Callers never wait longer than `timeout`; a slow or
+#     failing upstream yields None ("unknown") and the answer still lands in the cache for next time.
+#   - `python username_service.py --port 5055` runs a local stand-in user service for development and tests.
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from metrics import metrics
+
+# Always unavailable, no service round-trip needed.
+RESERVED_USERNAMES = ("admin", "test", "root")
+
+
+class UsernameChecker:
+    def __init__(self, base_url, timeout=0.5, max_connections=20, max_concurrency=10,
+                 available_ttl=30, taken_ttl=600, cache_max_entries=10000):
+        import httpx
+        self.timeout = timeout
+        self.available_ttl = available_ttl
+        self.taken_ttl = taken_ttl
+        self.cache_max_entries = cache_max_entries
+        self._cache = OrderedDict()   # name -> (available, expires_at), least recently used first
+        self._cache_lock = threading.Lock()
+        self._inflight = {}       # name -> asyncio.Task, only touched on the loop thread
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="username-checker", daemon=True)
+        self._thread.start()
+
+        async def setup():
+            self._client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=httpx.Timeout(timeout * 4),   # upstream may finish after the caller gave up; cache it then
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            )
+            self._semaphore = asyncio.Semaphore(max_concurrency)
+        asyncio.run_coroutine_threadsafe(setup(), self._loop).result()
+
+    # --- Cache --------------------------------------------------------------
+    def _cache_get(self, name):
+        with self._cache_lock:
+            hit = self._cache.get(name)
+            if hit is None:
+                return None
+            if hit[1] <= time.monotonic():
+                del self._cache[name]
+                return None
+            self._cache.move_to_end(name)
+            return hit[0]
+
+    def _cache_put(self, name, available):
+        ttl = self.available_ttl if available else self.taken_ttl
+        with self._cache_lock:
+            self._cache[name] = (available, time.monotonic() + ttl)
+            self._cache.move_to_end(name)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    # --- Loop-side lookups -------------------------------------------------
+    async def _fetch(self, name):
+        async with self._semaphore:
+            metrics.incr("username_lookups")
+            response = await self._client.get(f"/users/{quote(name, safe='')}/available")
+            response.raise_for_status()
+            available = bool(response.json()["available"])
+        self._cache_put(name, available)
+        return available
+
+    async def _check(self, name):
+        task = self._inflight.get(name)
+        if task is None:
+            task = self._loop.create_task(self._fetch(name))
+            self._inflight[name] = task
+            task.add_done_callback(lambda _: self._inflight.pop(name, None))
+        else:
+            metrics.incr("username_coalesced")
+        try:
+            # shield: one caller timing out must not cancel the lookup the others are waiting on.
+            return await asyncio.shield(task)
+        except Exception as e:
+            metrics.incr("username_errors")
+            print(f"WARNING: Username lookup for '{name}' failed: {e}")
+            return None
+
+    # --- Caller-side API ----------------------------------------------------
+    def is_available(self, username):
+        """True / False, or None when the service could not answer within `timeout`."""
+        name = username.strip().lower()
+        if name in RESERVED_USERNAMES:
+            return False
+        cached = self._cache_get(name)
+        if cached is not None:
+            metrics.incr("username_cache_hits")
+            return cached
+        future = asyncio.run_coroutine_threadsafe(self._check(name), self._loop)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            metrics.incr("username_timeouts")
+            return None
+
+    def prefetch(self, usernames):
+        """Start lookups without waiting, so several username fields resolve concurrently."""
+        for username in usernames:
+            if not isinstance(username, str): continue
+            name = username.strip().lower()
+            if name and name not in RESERVED_USERNAMES and self._cache_get(name) is None:
+                asyncio.run_coroutine_threadsafe(self._check(name), self._loop)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+# --- Local stand-in user service ----------------------------------------------
+def make_stand_in_server(port=5055, taken=(), latency_ms=0):
+    taken_names = {name.lower() for name in tuple(taken) + RESERVED_USERNAMES}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) != 3 or parts[0] != "users" or parts[2] != "available":
+                self.send_error(404)
+                return
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            body = json.dumps({"available": unquote(parts[1]).lower() not in taken_names}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the user service.")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--taken", default="", help="Comma-separated usernames to report as taken.")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Artificial delay per request.")
+    args = parser.parse_args()
+    server = make_stand_in_server(args.port, [n for n in args.taken.split(",") if n], args.latency_ms)
+    print(f"Stand-in user service on http://127.0.0.1:{args.port} (set USER_SERVICE_URL to use it)")
+    server.serve_forever()
@@ -0,0 +1,323 @@
+# validators.py
+# Submission validation, on the server and compiled for the browser.
+#   - validate_submission() is the authoritative server-side check used by /submit.
+#   - compile_bundle() turns a schema into a portable bundle of constraint descriptors and regex
+#     sources, so the frontend can reject bad input without a /submit round trip.
+#   - frontend/src/src/validation/checkBundle.js evaluates a bundle in the browser.
+#     ValidationParity.py runs it under Node and checks that it agrees with validate_submission.
+#
+# Bundle evaluation, per field in order:
+#   value = values[id] or ""; empty and "required" -> required message, next field; empty -> next field.
+#   Run `checks` in order; every failing check sets the field's message (the last failure wins).
+#   A {"kind": "cross"} entry runs the bundle's crossChecks at that point, which may set other fields' messages.
+#   A "serverOnly" field has a pattern the browser cannot run exactly; only its required and cross
+#   checks run there, and /submit judges the rest.
+# Check kinds:
+#   minLength / maxLength  {value}                       length in code points ([...s].length in JS)
+#   regex      {pattern, test: "full"|"search", invalidIf: "noMatch"|"match", removeSpaces}
+#   date       {pattern}                                 full match of groups (year, month, day), and a real calendar date
+#   integer    {pattern, min, max, rangeMessage}         full match, then min <= int(value) <= max; more than
+#                                                        bundle.maxDigits digits is not a number (Python's int() limit)
+#   reserved   {values}                                  value.strip().lower() must not be listed; the server
+#                                                        may still reject it after asking the user service
+#   file       {fileTypes, maxSizeMB}                    pre-check for the selected file; not part of the parity corpus
+# Patterns are JavaScript RegExp sources for the "u" flag, translated from Python's syntax tree.
+# \p{Python_d} / \p{Python_w} / \p{Python_s} stand for the ranges in bundle.classes, which hold exactly
+# what Python's \d, \w and \s match (the browser's own classes follow other Unicode versions and
+# whitespace rules). Python's strip() and int() use the same \s and \d, via classes.s and digitZeros.
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse   # Python 3.11+
+except ImportError:
+    import sre_parse
+
+BUNDLE_VERSION = 2
+
+# rule -> (pattern, message, ignore spaces); patterns are matched against the whole value.
+RULE_PATTERNS = {
+    "email_format": (r"[\w\.-]+@[\w\.-]+\.[A-Za-z]{2,}", "Must be a valid email address.", False),
+    "phone_number": (r"\d{11}", "Must be exactly 11 digits.", False),
+    "credit_card_format": (r"\d{13,19}", "Must be 13–19 digits (spaces allowed).", True),
+    "expiry_format": (r"(0[1-9]|1[0-2])\/([2-9]\d)", "Must be in MM/YY format.", False),
+    "national_id": (r"\d{5}-\d{7}-\d", "Invalid National ID format.", False),
+    "alphanumeric": (r"[A-Za-z0-9]+", "Only letters and numbers allowed.", False),
+}
+RESERVED_MESSAGE = "Username is already taken."
+HTML_PATTERN = r"<[^>]+>"
+
+# What float(), int() and strptime("%Y-%m-%d") accept, written out as patterns for the bundle.
+# float() and int() strip Unicode whitespace except \x1c-\x1f, which \s (and str.strip()) include.
+_DIGITS = r"\d(?:_?\d)*"
+_SPACE = r"(?:(?![\x1c-\x1f])\s)*"
+FLOAT_PATTERN = (rf"{_SPACE}[+-]?(?:(?:{_DIGITS})?\.{_DIGITS}(?:[eE][+-]?{_DIGITS})?|{_DIGITS}\.?(?:[eE][+-]?{_DIGITS})?"
+                 rf"|[iI][nN][fF](?:[iI][nN][iI][tT][yY])?|[nN][aA][nN]){_SPACE}")
+INT_PATTERN = rf"{_SPACE}[+-]?{_DIGITS}{_SPACE}"
+DATE_PATTERN = r"(\d\d\d\d)-(1[0-2]|0[1-9]|[1-9])-(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])"
+
+
+def check_schema(schema):
+    """ValueError unless `schema` is a list of field objects with string ids, object rules and valid patterns."""
+    if not isinstance(schema, list):
+        raise ValueError("schema must be a list of fields.")
+    for field in schema:
+        if not isinstance(field, dict) or not isinstance(field.get("id"), str):
+            raise ValueError("Each field must be an object with a string id.")
+        rules = field.get("validation")
+        if rules is not None and not isinstance(rules, dict):
+            raise ValueError(f"Field {field['id']}: validation must be an object.")
+        if rules and rules.get("pattern"):
+            try:
+                re.compile(rules["pattern"])
+            except (TypeError, re.error):
+                raise ValueError(f"Field {field['id']}: pattern must be a valid regular expression.") from None
+
+
+def validate_submission(values: dict, schema: list, username_taken, upload_exists):
+    errors = {}
+    for field in schema:
+        fid   = field["id"]
+        rules = field.get("validation") or {}
+        val   = values.get(fid, "")
+
+        if rules.get("required") and not val:
+            errors[fid] = "This field is required."
+            continue
+        if not val: continue
+
+        if field.get("type") == "file":
+            # Only references produced by the multipart upload path (stored, or staged by this request) count.
+            refs = val if isinstance(val, list) else [val]
+            if not all(isinstance(r, dict) and upload_exists(r.get("sha256")) for r in refs):
+                errors[fid] = "Please upload the file again."
+            continue
+
+        if "minLength" in rules and len(val) < rules["minLength"]: errors[fid] = f"Must be at least {rules['minLength']} characters."
+        if "maxLength" in rules and len(val) > rules["maxLength"]: errors[fid] = f"Must be no more than {rules['maxLength']} characters."
+        if (p := rules.get("pattern")) and not re.fullmatch(p, val): errors[fid] = "Invalid format."
+
+        rule = rules.get("rule")
+        if rule in RULE_PATTERNS:
+            pattern, message, ignore_spaces = RULE_PATTERNS[rule]
+            if not re.fullmatch(pattern, val.replace(" ", "") if ignore_spaces else val): errors[fid] = message
+        elif rule == "available_username" and username_taken(val): errors[fid] = RESERVED_MESSAGE
+
+        if "PASSWORD" in values and "CONFIRM_PASSWORD" in values and values["PASSWORD"] != values["CONFIRM_PASSWORD"]:
+            errors["CONFIRM_PASSWORD"] = "Passwords do not match."
+
+        try:
+            if field.get("type") == "number": float(val)
+            elif field.get("type") == "date": from datetime import datetime; datetime.strptime(val, "%Y-%m-%d")
+        except ValueError: errors[fid] = f"Must be a valid {field.get('type')}."
+
+        if field.get("type") == "rating" and val:
+            try:
+                r, mn, mx = int(val), rules.get("min",1), rules.get("max",7)
+                if r < mn or r > mx: errors[fid] = f"Rating must be between {mn} and {mx}."
+            except ValueError: errors[fid] = "Rating must be a number."
+
+        if re.search(HTML_PATTERN, val): errors[fid] = "HTML tags are not allowed."
+    return errors
+
+
+# --- Client bundle ----------------------------------------------------------
+class UntranslatablePattern(ValueError):
+    """A pattern the browser cannot evaluate exactly like Python's re."""
+
+
+_JS_SYNTAX = set("^$\\.*+?()[]{}|/")
+_ALLOWED_FLAGS = re.UNICODE | re.VERBOSE
+_CLASS_REF = re.compile(r"\\p\{Python_([dsw])\}")
+# Python class escape -> (bundle.classes entry, negated)
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: ("d", False), sre_parse.CATEGORY_NOT_DIGIT: ("d", True),
+    sre_parse.CATEGORY_WORD: ("w", False), sre_parse.CATEGORY_NOT_WORD: ("w", True),
+    sre_parse.CATEGORY_SPACE: ("s", False), sre_parse.CATEGORY_NOT_SPACE: ("s", True),
+}
+_REPEAT_SUFFIX = {(0, sre_parse.MAXREPEAT): "*", (1, sre_parse.MAXREPEAT): "+", (0, 1): "?"}
+
+
+def _js_char(code, in_class=False):
+    ch = chr(code)
+    if ch in _JS_SYNTAX or (in_class and ch == "-"): return "\\" + ch
+    return ch if 0x20 <= code < 0x7f else f"\\u{{{code:X}}}"
+
+
+@lru_cache(maxsize=None)
+def class_tables():
+    """{"d", "w", "s"} -> JS class body with exactly the code points Python's \\d, \\w, \\s match."""
+    tests = {"d": str.isdecimal, "w": lambda ch: ch.isalnum() or ch == "_", "s": str.isspace}
+    tables = {}
+    for name, test in tests.items():
+        ranges = []
+        for code in range(sys.maxunicode + 1):
+            if not test(chr(code)): continue
+            if ranges and ranges[-1][1] == code - 1: ranges[-1][1] = code
+            else: ranges.append([code, code])
+        tables[name] = "".join(_js_char(lo, True) + (f"-{_js_char(hi, True)}" if hi > lo else "") for lo, hi in ranges)
+    return tables
+
+
+@lru_cache(maxsize=None)
+def digit_zeros():
+    """Code points of every Unicode decimal zero; digit d of a script is zero + d."""
+    return [code for code in range(sys.maxunicode + 1) if chr(code).isdecimal() and unicodedata.decimal(chr(code)) == 0]
+
+
+class _JsTranslator:
+    """Python regex syntax tree -> JavaScript source; anything without an exact equivalent raises."""
+
+    def seq(self, items):
+        return "".join(self.node(op, av) for op, av in items)
+
+    def atom(self, items):
+        text = self.seq(items)
+        if len(items) == 1 and items[0][0] in (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.IN):
+            return text
+        return f"(?:{text})"
+
+    def node(self, op, av):
+        if op == sre_parse.LITERAL: return _js_char(av)
+        if op == sre_parse.NOT_LITERAL: return f"[^{_js_char(av, True)}]"
+        if op == sre_parse.ANY: return r"[^\n]"   # JS "." also stops at \r, \u2028 and \u2029
+        if op == sre_parse.IN: return self.char_class(av)
+        if op == sre_parse.BRANCH: return "(?:" + "|".join(self.seq(branch) for branch in av[1]) + ")"
+        if op == sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, items = av
+            if (add_flags | del_flags) & ~_ALLOWED_FLAGS:
+                raise UntranslatablePattern("inline flags")
+            # Named groups become plain ones: the numbering stays and nothing refers to them by name.
+            return ("(?:" if group is None else "(") + self.seq(items) + ")"
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            lo, hi, items = av
+            suffix = _REPEAT_SUFFIX.get((lo, hi)) or (
+                f"{{{lo},}}" if hi == sre_parse.MAXREPEAT else f"{{{lo}}}" if lo == hi else f"{{{lo},{hi}}}")
+            return self.atom(items) + suffix + ("?" if op == sre_parse.MIN_REPEAT else "")
+        if op == sre_parse.AT:
+            if av in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING): return "^"
+            if av == sre_parse.AT_END_STRING: return "$"
+            if av == sre_parse.AT_END: return r"(?=\n?$)"   # Python's $ also matches before a final newline
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) and av[0] == 1:
+            return ("(?=" if op == sre_parse.ASSERT else "(?!") + self.seq(av[1]) + ")"
+        raise UntranslatablePattern(f"{op} {av!r}")
+
+    def char_class(self, items):
+        negate = bool(items) and items[0][0] == sre_parse.NEGATE
+        if negate: items = items[1:]
+        if len(items) == 1 and items[0][0] == sre_parse.CATEGORY and items[0][1] in _CATEGORIES:
+            name, inverted = _CATEGORIES[items[0][1]]
+            return ("[^" if inverted != negate else "[") + f"\\p{{Python_{name}}}]"
+        parts = []
+        for op, av in items:
+            if op == sre_parse.LITERAL: parts.append(_js_char(av, True))
+            elif op == sre_parse.RANGE: parts.append(f"{_js_char(av[0], True)}-{_js_char(av[1], True)}")
+            elif op == sre_parse.CATEGORY and _CATEGORIES.get(av, (None, True))[1] is False:
+                parts.append(f"\\p{{Python_{_CATEGORIES[av][0]}}}")
+            else:
+                raise UntranslatablePattern(f"{op} {av!r} in a set")
+        return ("[^" if negate else "[") + "".join(parts) + "]"
+
+
+def to_js_pattern(pattern):
+    """Python regex source -> JavaScript "u"-flag source that matches the same strings, or UntranslatablePattern."""
+    parsed = sre_parse.parse(pattern)
+    flags = parsed.state.flags if hasattr(parsed, "state") else parsed.pattern.flags
+    if flags & ~_ALLOWED_FLAGS:
+        raise UntranslatablePattern("inline flags")
+    return _JsTranslator().seq(parsed)
+
+
+def _regex(pattern, message, test="full", invalid_if="noMatch", remove_spaces=False):
+    check = {"kind": "regex", "pattern": to_js_pattern(pattern), "test": test, "invalidIf": invalid_if, "message": message}
+    if remove_spaces: check["removeSpaces"] = True
+    return check
+
+
+def compile_field(field, reserved_usernames):
+    rules = field.get("validation") or {}
+    ftype = field.get("type")
+    compiled = {"id": field["id"], "required": bool(rules.get("required")), "checks": []}
+    checks = compiled["checks"]
+    if ftype == "file":
+        checks.append({"kind": "file", "fileTypes": rules.get("fileTypes") or [], "maxSizeMB": rules.get("maxSizeMB")})
+        return compiled
+
+    if "minLength" in rules:
+        checks.append({"kind": "minLength", "value": rules["minLength"], "message": f"Must be at least {rules['minLength']} characters."})
+    if "maxLength" in rules:
+        checks.append({"kind": "maxLength", "value": rules["maxLength"], "message": f"Must be no more than {rules['maxLength']} characters."})
+    if rules.get("pattern"):
+        try:
+            checks.append(_regex(rules["pattern"], "Invalid format."))
+        except UntranslatablePattern:
+            # Python-only syntax (backreferences, inline flags, \b, lookbehind, ...): /submit decides.
+            return {**compiled, "serverOnly": True, "checks": [{"kind": "cross"}]}
+    rule = rules.get("rule")
+    if rule in RULE_PATTERNS:
+        pattern, message, ignore_spaces = RULE_PATTERNS[rule]
+        checks.append(_regex(pattern, message, remove_spaces=ignore_spaces))
+    elif rule == "available_username":
+        checks.append({"kind": "reserved", "values": list(reserved_usernames), "message": RESERVED_MESSAGE})
+    checks.append({"kind": "cross"})
+    if ftype == "number":
+        checks.append(_regex(FLOAT_PATTERN, "Must be a valid number."))
+    elif ftype == "date":
+        checks.append({"kind": "date", "pattern": to_js_pattern(DATE_PATTERN), "message": "Must be a valid date."})
+    if ftype == "rating":
+        mn, mx = rules.get("min", 1), rules.get("max", 7)
+        checks.append({"kind": "integer", "pattern": to_js_pattern(INT_PATTERN), "min": mn, "max": mx,
+                       "message": "Rating must be a number.", "rangeMessage": f"Rating must be between {mn} and {mx}."})
+    checks.append(_regex(HTML_PATTERN, "HTML tags are not allowed.", test="search", invalid_if="match"))
+    return compiled
+
+
+def compile_bundle(schema, digest, reserved_usernames=()):
+    check_schema(schema)
+    ids = {field.get("id") for field in schema}
+    cross = []
+    if {"PASSWORD", "CONFIRM_PASSWORD"} <= ids:
+        cross.append({"kind": "equals", "field": "CONFIRM_PASSWORD", "other": "PASSWORD", "message": "Passwords do not match."})
+    fields = [compile_field(field, reserved_usernames) for field in schema if field.get("id")]
+    # Only the class tables some pattern refers to are shipped; \s is always needed for strip().
+    used = {"s"} | {name for field in fields for check in field["checks"]
+                    for name in _CLASS_REF.findall(check.get("pattern", ""))}
+    return {
+        "version": BUNDLE_VERSION,
+        "schema_hash": digest,
+        "flags": "u",
+        "classes": {name: class_tables()[name] for name in sorted(used)},
+        "digitZeros": digit_zeros(),
+        "maxDigits": getattr(sys, "get_int_max_str_digits", lambda: 0)(),
+        "fields": fields,
+        "crossChecks": cross,
+    }
+
+
+class BundleCache:
+    """Compiled bundles by schema hash, least recently used evicted first."""
+
+    def __init__(self, hash_schema, reserved_usernames=(), max_entries=1024):
+        self.hash_schema = hash_schema
+        self.reserved_usernames = reserved_usernames
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._bundles = OrderedDict()
+
+    def get(self, schema):
+        digest = self.hash_schema(schema)
+        with self._lock:
+            bundle = self._bundles.get(digest)
+            if bundle is not None:
+                self._bundles.move_to_end(digest)
+                return bundle
+        bundle = compile_bundle(schema, digest, self.reserved_usernames)
+        with self._lock:
+            self._bundles[digest] = bundle
+            while len(self._bundles) > self.max_entries:
+                self._bundles.popitem(last=False)
+        return bundle
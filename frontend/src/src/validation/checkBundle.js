@@ -0,0 +1,116 @@
+/**
+ * checkBundle
+ *
+ * Evaluates a validator bundle from the backend (see backend/validators.py for the format)
+ * against the form values, the same way /submit will. Fields marked serverOnly only get their
+ * required check here. backend/ValidationParity.py runs this module under Node.
+ *
+ * @param {object} bundle - Bundle from /process or /forms/<hash>/validators
+ * @param {object} values - Field id -> entered value (strings)
+ * @returns {object} Field id -> error message, empty when the browser finds nothing wrong
+ */
+export function checkBundle(bundle, values) {
+  const errors = {};
+  const has = (id) => Object.prototype.hasOwnProperty.call(values, id);
+
+  for (const field of bundle.fields) {
+    const val = has(field.id) ? values[field.id] : '';
+    if (val === '' || val === null || val === undefined) {
+      if (field.required) errors[field.id] = 'This field is required.';
+      continue;
+    }
+    for (const check of field.checks) {
+      if (check.kind === 'cross') {
+        for (const cross of bundle.crossChecks) {
+          if (has(cross.field) && has(cross.other) && values[cross.field] !== values[cross.other]) {
+            errors[cross.field] = cross.message;
+          }
+        }
+        continue;
+      }
+      const message = failure(bundle, check, val);
+      if (message) errors[field.id] = message;
+    }
+  }
+  return errors;
+}
+
+// Compiled patterns per bundle, so repeated checks do not rebuild the large class tables.
+const compiled = new WeakMap();
+
+function regex(bundle, source, full) {
+  let cache = compiled.get(bundle);
+  if (!cache) {
+    cache = new Map();
+    compiled.set(bundle, cache);
+  }
+  const key = (full ? 'full:' : 'search:') + source;
+  if (!cache.has(key)) {
+    const expanded = source.replace(/\\p\{Python_([dsw])\}/g, (_, name) => bundle.classes[name]);
+    cache.set(key, new RegExp(full ? `^(?:${expanded})$` : expanded, bundle.flags));
+  }
+  return cache.get(key);
+}
+
+// Python's str.strip(): the whitespace set is the bundle's \s table, not String.prototype.trim's.
+function strip(bundle, value) {
+  const ws = `[${bundle.classes.s}]`;
+  return value.replace(new RegExp(`^${ws}+|${ws}+$`, 'gu'), '');
+}
+
+// Python's int() on a string the integer pattern already matched: Unicode digits, "_" separators.
+function toInteger(bundle, value) {
+  let text = strip(bundle, value);
+  let sign = 1n;
+  if (text[0] === '+' || text[0] === '-') {
+    if (text[0] === '-') sign = -1n;
+    text = text.slice(1);
+  }
+  let result = 0n;
+  let digits = 0;
+  for (const ch of text) {
+    if (ch === '_') continue;
+    const code = ch.codePointAt(0);
+    const zero = bundle.digitZeros.find((z) => z <= code && code <= z + 9);
+    result = result * 10n + BigInt(code - zero);
+    digits += 1;
+  }
+  if (bundle.maxDigits && digits > bundle.maxDigits) return null;
+  return sign * result;
+}
+
+function isRealDate(year, month, day) {
+  const leap = (year % 4 === 0 && year % 100 !== 0) || year % 400 === 0;
+  const days = [31, leap ? 29 : 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31];
+  return year >= 1 && month >= 1 && month <= 12 && day >= 1 && day <= days[month - 1];
+}
+
+function failure(bundle, check, val) {
+  switch (check.kind) {
+    case 'minLength':
+      return [...val].length < check.value ? check.message : null;
+    case 'maxLength':
+      return [...val].length > check.value ? check.message : null;
+    case 'reserved':
+      return check.values.includes(strip(bundle, val).toLowerCase()) ? check.message : null;
+    case 'regex': {
+      const subject = check.removeSpaces ? val.replaceAll(' ', '') : val;
+      const matched = regex(bundle, check.pattern, check.test === 'full').test(subject);
+      return (check.invalidIf === 'match' ? matched : !matched) ? check.message : null;
+    }
+    case 'date': {
+      const m = regex(bundle, check.pattern, true).exec(val);
+      if (!m) return check.message;
+      const [year, month, day] = m.slice(1, 4).map((part) => Number(toInteger(bundle, part)));
+      return isRealDate(year, month, day) ? null : check.message;
+    }
+    case 'integer': {
+      if (!regex(bundle, check.pattern, true).test(val)) return check.message;
+      const n = toInteger(bundle, val);
+      if (n === null) return check.message;
+      return n < check.min || n > check.max ? check.rangeMessage : null;
+    }
+    default:
+      return null; // file checks need the selected file itself
+  }
+}